@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class AillaConfig(AppConfig):
+    name = "ailla"
+
+    def ready(self):
+        # connect the signal receivers that keep solr, the collection cards and trees, the authority
+        # snapshots and the list caches in sync
+        from . import authority_snapshots, authority_updates, collection_cards, collection_tree, pagination_utils
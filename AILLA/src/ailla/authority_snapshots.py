@@ -0,0 +1,199 @@
+import hashlib
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from rest_framework.renderers import JSONRenderer
+
+from .deferred import on_commit_batch
+from .models import Text, Languages, Countries, Organizations, MediaContentType, Genre, ParticipantRoles, OriginalMediaType
+
+"""
+Versioned in-memory snapshots of the small, read-mostly tables: languages, countries,
+organizations and the controlled vocabularies.
+
+Each worker keeps one row tuple per record, with its Text fields inlined as (id, en, es, pt)
+tuples, loaded with a single values_list query. The `all` actions, the nested Simple*
+serializers and the autosuggest indexes read records from it instead of the database.
+
+A save or delete of a record, or a save of a Text it shows, replaces the version token of
+the table in the Django cache after the transaction commits. Every worker compares its
+snapshot's version with the shared one (at most once per check_interval seconds) and
+reloads the table when they differ. Snapshots are also reloaded after max_age seconds,
+which bounds staleness when the cache isn't shared between workers. A Text save only changes
+the version when this worker has the table loaded, edits made through the record's own
+serializer always do.
+
+Whole responses built from a snapshot can be kept as rendered JSON bytes with an ETag (see
+rendered), until the snapshot is reloaded.
+"""
+
+TEXT_LANGUAGES = ("en", "es", "pt")
+
+# what the controlled vocabulary endpoints return for each term
+VOCABULARY_FIELDS = ("id", "name", "description")
+
+def text_data(text):
+    """a (id, en, es, pt) tuple as TextSerializer data"""
+    if text is None:
+        return None
+    return {"id": text[0], "en": text[1], "es": text[2], "pt": text[3]}
+
+
+class snapshot_state:
+    """one load of a table, the rows are never modified once loaded"""
+    def __init__(self, rows, version):
+        # {pk: row tuple}, in id order
+        self.rows = rows
+        self.version = version
+        # ids of the Text rows inlined in the rows
+        self.texts = set()
+        # {key: (etag, JSON bytes)} of the responses rendered from this load
+        self.rendered = {}
+        self.loaded = self.checked = time.monotonic()
+
+
+def bump_snapshots(snapshots):
+    """replaces the version token of each snapshot, so every worker reloads them"""
+    cache.set_many({snapshot.cache_key: uuid.uuid4().hex for snapshot in snapshots}, timeout=None)
+    for snapshot in snapshots:
+        snapshot.state = None
+
+# snapshots whose table was written during the current transaction, each bumped once
+snapshot_bumps = on_commit_batch(bump_snapshots, "authority snapshots")
+
+class authority_snapshot:
+    """
+    in-memory copy of one table
+
+    Usage::
+
+        languages_snapshot.serialize(pk, ("id", "name", "language_code"))
+        languages_snapshot.serialize_all(("id", "name", "language_code"))
+    """
+    def __init__(self, model, value_fields=(), text_fields=("name",), max_age=300, check_interval=1):
+        self.model = model
+        self.value_fields = tuple(value_fields)
+        self.text_fields = tuple(text_fields)
+        self.fields = ("id", *self.value_fields, *self.text_fields)
+        self.positions = {field: position for position, field in enumerate(self.fields)}
+        self.max_age = max_age
+        self.check_interval = check_interval
+        self.cache_key = f"authority_snapshot_version_{model.__name__}"
+        self.state = None
+        self.lock = threading.Lock()
+
+        uid = f"authority_snapshot_{model.__name__}"
+        post_save.connect(self.changed, sender=model, weak=False, dispatch_uid=uid)
+        post_delete.connect(self.changed, sender=model, weak=False, dispatch_uid=uid)
+        post_save.connect(self.text_changed, sender=Text, weak=False, dispatch_uid=uid)
+
+    def current_version(self):
+        """the version token shared through the cache, a new one if it was evicted"""
+        return cache.get_or_set(self.cache_key, lambda: uuid.uuid4().hex, timeout=None)
+
+    def load(self):
+        """reads the whole table in one query"""
+        version = self.current_version()
+        columns = ["id", *self.value_fields]
+        for field in self.text_fields:
+            columns += [f"{field}_id", *(f"{field}__{language}" for language in TEXT_LANGUAGES)]
+
+        rows = {}
+        width = 1 + len(self.value_fields)
+        for values in self.model.objects.order_by("id").values_list(*columns):
+            texts = tuple(
+                values[start:start + 4] if values[start] is not None else None
+                for start in range(width, len(values), 4)
+            )
+            rows[values[0]] = values[:width] + texts
+
+        state = snapshot_state(rows, version)
+        state.texts.update(text[0] for row in rows.values() for text in row[width:] if text is not None)
+        return state
+
+    def get_state(self):
+        """the snapshot, reloaded if the shared version changed or it is too old"""
+        state = self.state
+        now = time.monotonic()
+        if state is not None and now - state.checked < self.check_interval:
+            return state
+
+        if state is None or now - state.loaded > self.max_age or state.version != self.current_version():
+            with self.lock:
+                if self.state is state:
+                    self.state = self.load()
+                state = self.state
+        else:
+            state.checked = now
+        return state
+
+    @property
+    def version(self):
+        """changes whenever the snapshot is reloaded"""
+        return id(self.get_state())
+
+    def rows(self):
+        """every row tuple, in id order"""
+        return self.get_state().rows.values()
+
+    def get(self, pk):
+        """the row tuple of a record, None if the snapshot doesn't have it"""
+        return self.get_state().rows.get(pk)
+
+    def value(self, row, field):
+        """a field of a row tuple, Text fields as TextSerializer data"""
+        value = row[self.positions[field]]
+        return text_data(value) if field in self.text_fields else value
+
+    def data(self, row, fields):
+        return {field: self.value(row, field) for field in fields}
+
+    def serialize(self, pk, fields):
+        """the given fields of a record, None if the snapshot doesn't have it"""
+        row = self.get(pk)
+        return None if row is None else self.data(row, fields)
+
+    def serialize_all(self, fields):
+        return [self.data(row, fields) for row in self.rows()]
+
+    def rendered(self, key, build):
+        """
+        (etag, JSON bytes) of build()'s data, rendered once per snapshot load. The ETag is a hash
+        of the bytes, so it only changes when the response does and is the same on every worker
+
+        Usage::
+
+            etag, content = genres_snapshot.rendered("all", lambda: genres_snapshot.serialize_all(VOCABULARY_FIELDS))
+        """
+        state = self.get_state()
+        found = state.rendered.get(key)
+        if found is None:
+            content = JSONRenderer().render(build())
+            found = state.rendered[key] = (f'"{hashlib.blake2b(content, digest_size=16).hexdigest()}"', content)
+        return found
+
+    def invalidate(self):
+        """makes every worker reload the table once the current transaction commits"""
+        snapshot_bumps.add([self])
+
+    def changed(self, sender, instance, **kwargs):
+        """post_save/post_delete receiver"""
+        self.invalidate()
+
+    def text_changed(self, sender, instance, created, **kwargs):
+        """Text post_save receiver, only Text rows shown by the snapshot matter"""
+        state = self.state
+        if not created and state is not None and instance.pk in state.texts:
+            self.invalidate()
+
+
+languages_snapshot = authority_snapshot(Languages, ("language_code",))
+countries_snapshot = authority_snapshot(Countries, ("country_code", "flag_code"))
+organizations_snapshot = authority_snapshot(Organizations, ("acronym",), ("org_name",))
+media_content_types_snapshot = authority_snapshot(MediaContentType, text_fields=("name", "description"))
+genres_snapshot = authority_snapshot(Genre, text_fields=("name", "description"))
+participant_roles_snapshot = authority_snapshot(ParticipantRoles, text_fields=("name", "description"))
+original_media_types_snapshot = authority_snapshot(OriginalMediaType, text_fields=("name", "description"))
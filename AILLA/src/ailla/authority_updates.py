@@ -0,0 +1,183 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from core.logger import logger
+from .deferred import on_commit_batch
+from .models import Collections, Folders, Languages, Countries, Organizations, Persons, Text
+from .solr import solr, FACET_FIELDS, CONTENT_HASH_FIELD
+
+"""
+Keeps the solr documents that embed authority records (Languages, Countries, Organizations, Persons)
+up to date when one of those records, or the Text holding its name, is renamed.
+
+The dependent Collections and Folders are found through the relation tables, then rebuilt with
+bulk_documents: a rename costs a full rebuild of the affected documents, from values() queries and
+without the solr serializers. Only the fields built from the record, their facets and the content
+hash are sent to solr, as atomic "set" updates, and the hash matches what solr_index --changed-only
+computes for the whole document.
+"""
+
+# For each authority model: (indexed model, relation on the indexed model, solr field prefix)
+# matching the field names used by CollectionsSolrSerializer and FoldersSolrSerializer
+AUTHORITY_FIELDS = {
+    Languages: [
+        (Collections, "collection_languages", "languages"),
+        (Collections, "lang_indigenous_title", "title_indig_language"),
+        (Collections, "lang_indigenous_description", "description_indig_language"),
+        (Folders, "subject_languages", "languages"),
+        (Folders, "lang_indigenous_title", "title_indig_language"),
+        (Folders, "lang_indigenous_description", "description_indig_language"),
+    ],
+    Countries: [
+        (Collections, "countries", "countries"),
+        (Folders, "countries", "countries"),
+    ],
+    Organizations: [
+        (Collections, "collectors_orgs", "collectors_orgs"),
+        (Collections, "depositors_orgs", "depositors_orgs"),
+    ],
+    Persons: [
+        (Collections, "collectors_persons", "collectors_persons"),
+        (Collections, "depositors_persons", "depositors_persons"),
+    ],
+}
+
+# Values read from each authority model to build its solr fields
+AUTHORITY_LOOKUPS = {
+    Languages: ["name__en", "name__es", "name__pt", "language_code"],
+    Countries: ["name__en", "name__es", "name__pt", "country_code"],
+    Organizations: ["org_name__en", "org_name__es", "org_name__pt"],
+    Persons: ["given_name", "surname"],
+}
+
+def to_str(value):
+    """what a DRF CharField outputs"""
+    return None if value is None else str(value)
+
+def solr_values(model, prefix, many, row):
+    """maps the looked up values of one authority record to {solr field: value}, named like the solr serializers name them"""
+    if model is Persons:
+        return {prefix: f"{row[0]} {row[1]}"}
+
+    values = {
+        f"{prefix}_en": row[0],
+        f"{prefix}_es": row[1],
+        f"{prefix}_pt": row[2],
+    }
+    if len(row) > 3:
+        values[f"{prefix}_codes" if many else f"{prefix}_code"] = row[3]
+    return values
+
+def collect_updates(model, pks, updates:dict):
+    """
+    adds {solr id: set of solr fields} to updates for every published document that embeds one of
+    the records, the fields being the ones built from the records. Only the documents are looked up,
+    their values come from rebuilt_updates
+    """
+    for indexed_model, relation, prefix in AUTHORITY_FIELDS[model]:
+        field = indexed_model._meta.get_field(relation)
+        solr_fields = solr_values(model, prefix, field.many_to_many, [None] * len(AUTHORITY_LOOKUPS[model]))
+
+        if field.many_to_many:
+            # through the relation table, one query per relation
+            through = field.remote_field.through
+            source = field.m2m_field_name()
+            target = field.m2m_reverse_field_name()
+            doc_pks = through.objects.filter(
+                **{f"{target}_id__in": pks, f"{source}__draft": False}
+            ).values_list(f"{source}_id", flat=True)
+        else:
+            doc_pks = indexed_model.objects.filter(**{f"{relation}__in": pks}, draft=False).values_list("pk", flat=True)
+
+        for doc_pk in doc_pks:
+            updates.setdefault(f"{doc_pk}:{indexed_model.__name__}", set()).update(solr_fields)
+
+    return updates
+
+def rebuilt_updates(updates:dict):
+    """
+    rebuilds the documents in updates and returns their atomic updates: the collected fields,
+    the facets built from them and the content hash, with the values of the rebuilt document
+    """
+    # solr_documents imports this module
+    from .solr_documents import bulk_documents
+
+    by_model = {}
+    for solr_id in updates:
+        pk, model_name = solr_id.split(":")
+        by_model.setdefault(model_name, []).append(int(pk))
+
+    docs = []
+    for indexed_model in (Collections, Folders):
+        for doc in bulk_documents(indexed_model).build(by_model.get(indexed_model.__name__, [])):
+            fields = set(updates[doc["id"]])
+            fields.update(facet_field for facet_field, source_field in FACET_FIELDS.items() if source_field in fields)
+            fields.add(CONTENT_HASH_FIELD)
+            docs.append({"id": doc["id"], **{solr_field: doc[solr_field] for solr_field in fields}})
+    return docs
+
+def propagate_authority_change(model, pks, batch_size=500):
+    """
+    sends atomic updates for the fields embedding the given authority records
+    to every published document that references them
+
+    Returns:
+        int: number of solr documents updated
+    """
+    docs = rebuilt_updates(collect_updates(model, list(pks), {}))
+
+    for start in range(0, len(docs), batch_size):
+        batch = docs[start:start + batch_size]
+        field_updates = {solr_field: "set" for doc in batch for solr_field in doc if solr_field != "id"}
+        solr.add(batch, fieldUpdates=field_updates)
+
+    logger.debug(f"{model.__name__} {list(pks)}: updated {len(docs)} solr documents")
+    return len(docs)
+
+# For each authority model, the Text fields holding its name
+AUTHORITY_TEXTS = {
+    Languages: ["name"],
+    Countries: ["name"],
+    Organizations: ["org_name"],
+}
+
+def propagate_changes(rows):
+    """propagate_authority_change for the queued (model, pk) rows, Texts go to the records they name"""
+    pending = {model: set() for model in AUTHORITY_FIELDS}
+    texts = set()
+    for model, pk in rows:
+        (texts if model is Text else pending[model]).add(pk)
+
+    if texts:
+        for model, relations in AUTHORITY_TEXTS.items():
+            for relation in relations:
+                pending[model].update(model.objects.filter(**{f"{relation}__in": texts}).values_list("pk", flat=True))
+
+    for model, pks in pending.items():
+        if not pks:
+            continue
+        try:
+            propagate_authority_change(model, sorted(pks))
+        except Exception as e:
+            logger.error(f"Error updating solr documents for {model.__name__} {sorted(pks)}: {e}")
+
+# (model, pk) of the authority records and Texts saved during the current transaction
+authority_changes = on_commit_batch(propagate_changes, "authority solr documents")
+
+
+@receiver(post_save, sender=Languages)
+@receiver(post_save, sender=Countries)
+@receiver(post_save, sender=Organizations)
+@receiver(post_save, sender=Persons)
+def authority_saved(sender, instance, created, **kwargs):
+    """push renamed authority records to solr once the transaction commits"""
+    if created:
+        # nothing references a new record yet
+        return
+    authority_changes.add([(sender, instance.pk)])
+
+@receiver(post_save, sender=Text, dispatch_uid="authority_updates_texts")
+def text_saved(sender, instance, created, **kwargs):
+    """a renamed Text may be the name of an authority record, looked up once the transaction commits"""
+    if not created:
+        authority_changes.add([(Text, instance.pk)])
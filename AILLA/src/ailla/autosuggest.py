@@ -0,0 +1,135 @@
+import threading
+from bisect import bisect_left
+
+from unidecode import unidecode
+
+from .authority_snapshots import (
+    VOCABULARY_FIELDS, languages_snapshot, countries_snapshot, organizations_snapshot,
+    media_content_types_snapshot, genres_snapshot, participant_roles_snapshot, original_media_types_snapshot,
+)
+
+"""
+In-memory autosuggest for authority records and controlled vocabularies.
+
+Each autosuggest_index holds two sorted arrays of (folded term, pk) built from a table's
+authority snapshot (see authority_snapshots.py): one with the record's whole names in all three
+languages, its code and its id, and one with every word start inside them, so "aya" also finds
+"Quechua, Ayacucho". Terms are folded with unidecode like the *_neutral Text columns. A query is
+folded the same way and answered with a binary search for the first term starting with it, so no
+database query is needed once the index is built.
+
+Matches come in order: names equal to the query, names starting with it, then names with a word
+starting with it, alphabetically within each group. The scan stops once limit records are found.
+An empty query returns the first records by id, like the database query it replaces.
+
+An index is rebuilt from memory whenever its snapshot is reloaded, which happens after a
+record or its Text changes.
+"""
+
+def fold(value):
+    """lowercase ascii with single spaces, the form both terms and queries are compared in"""
+    return " ".join(unidecode(str(value)).casefold().split()) if value is not None else ""
+
+def word_starts(term):
+    """positions after the first where a word starts"""
+    return [i for i in range(1, len(term)) if term[i].isalnum() and not term[i - 1].isalnum()]
+
+
+class index_state:
+    """one build of an index, swapped in whole so readers never see a partial update"""
+    def __init__(self, snapshot_state, names, words):
+        self.snapshot_state = snapshot_state
+        self.names = names
+        self.words = words
+
+
+class autosuggest_index:
+    """
+    prefix index over the names and code of one snapshot table, returning the given fields
+
+    Usage::
+
+        languages_autosuggest = autosuggest_index(languages_snapshot, ("id", "name", "language_code"), "name", "language_code")
+        languages_autosuggest.search("quech", limit=10)
+    """
+    def __init__(self, snapshot, fields, text_field, code_field=None):
+        self.snapshot = snapshot
+        self.fields = fields
+        self.text_field = text_field
+        self.code_field = code_field
+        self.state = None
+        self.lock = threading.Lock()
+
+    def terms(self, row):
+        """the folded whole values and word starts a record can be found by"""
+        values = [str(row[0])]
+        text = self.snapshot.value(row, self.text_field)
+        if text is not None:
+            values += [text["en"], text["es"], text["pt"]]
+        if self.code_field is not None:
+            values.append(self.snapshot.value(row, self.code_field))
+
+        names = set()
+        words = set()
+        for value in values:
+            term = fold(value)
+            if term:
+                names.add(term)
+                words.update(term[start:] for start in word_starts(term))
+        return names, words - names
+
+    def build(self, snapshot_state):
+        names = []
+        words = []
+        for pk, row in snapshot_state.rows.items():
+            row_names, row_words = self.terms(row)
+            names.extend((term, pk) for term in row_names)
+            words.extend((term, pk) for term in row_words)
+        names.sort()
+        words.sort()
+        return index_state(snapshot_state, names, words)
+
+    def get_state(self):
+        """the index of the current snapshot, rebuilt when the snapshot was reloaded"""
+        snapshot_state = self.snapshot.get_state()
+        state = self.state
+        if state is None or state.snapshot_state is not snapshot_state:
+            with self.lock:
+                if self.state is None or self.state.snapshot_state is not snapshot_state:
+                    self.state = self.build(snapshot_state)
+                state = self.state
+        return state
+
+    def search(self, query, limit=10):
+        """the fields of the best limit matches for the query"""
+        if limit <= 0:
+            return []
+        state = self.get_state()
+        rows = state.snapshot_state.rows
+
+        query = fold(query)
+        if not query:
+            return [self.snapshot.data(row, self.fields) for row, _ in zip(rows.values(), range(limit))]
+
+        found = []
+        seen = set()
+        for terms in (state.names, state.words):
+            position = bisect_left(terms, (query,))
+            while position < len(terms) and len(found) < limit:
+                term, pk = terms[position]
+                if not term.startswith(query):
+                    break
+                if pk not in seen:
+                    seen.add(pk)
+                    found.append(pk)
+                position += 1
+        return [self.snapshot.data(rows[pk], self.fields) for pk in found]
+
+
+languages_autosuggest = autosuggest_index(languages_snapshot, ("id", "name", "language_code"), "name", "language_code")
+countries_autosuggest = autosuggest_index(countries_snapshot, ("id", "name", "flag_code", "country_code"), "name", "country_code")
+organizations_autosuggest = autosuggest_index(organizations_snapshot, ("id", "org_name"), "org_name")
+media_content_types_autosuggest = autosuggest_index(media_content_types_snapshot, VOCABULARY_FIELDS, "name")
+genres_autosuggest = autosuggest_index(genres_snapshot, VOCABULARY_FIELDS, "name")
+participant_roles_autosuggest = autosuggest_index(participant_roles_snapshot, VOCABULARY_FIELDS, "name")
+original_media_types_autosuggest = autosuggest_index(original_media_types_snapshot, VOCABULARY_FIELDS, "name")
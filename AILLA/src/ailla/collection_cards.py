@@ -0,0 +1,137 @@
+from django.db.models import Prefetch, Q
+from django.db.models.signals import post_save, m2m_changed
+from django.dispatch import receiver
+
+from .deferred import on_commit_batch
+from .models import Collections, CollectionCards, Text, Languages, Countries, Organizations, Persons
+from .serializers_collections import CollectionCardsSerializer
+
+"""
+Denormalized cards for collection list pages.
+
+A card is the CollectionCardsSerializer output for one collection (title, description, languages,
+countries and contributors), stored as JSON in CollectionCards. List endpoints read the cards with
+the page query instead of joining and serializing every relation per row.
+
+Cards are rebuilt after any write that changes what they show: the collection itself, its
+many to many relations, its title/description Text, or a referenced authority record. Text saves
+only queue the Text id, the collections showing them are looked up once the transaction commits.
+"""
+
+# For each authority model, the Collections relations whose cards show it
+CARD_RELATIONS = {
+    Languages: ["collection_languages"],
+    Countries: ["countries"],
+    Organizations: ["collectors_orgs", "depositors_orgs"],
+    Persons: ["collectors_persons", "depositors_persons"],
+}
+
+def cards_queryset():
+    """Collections with everything a card shows loaded up front"""
+    return Collections.objects.select_related(
+        'title',
+        'description',
+    ).prefetch_related(
+        Prefetch('collectors_persons', queryset=Persons.objects.only('id', 'given_name', 'surname')),
+        Prefetch('collectors_orgs', queryset=Organizations.objects.select_related('org_name')),
+        Prefetch('depositors_persons', queryset=Persons.objects.only('id', 'given_name', 'surname')),
+        Prefetch('depositors_orgs', queryset=Organizations.objects.select_related('org_name')),
+        Prefetch('collection_languages', queryset=Languages.objects.select_related('name')),
+        Prefetch('countries', queryset=Countries.objects.select_related('name')),
+    )
+
+def rebuild_cards(collection_ids, chunk_size=500):
+    """
+    (re)writes the cards of the given collections, ids that no longer exist are ignored
+
+    Returns:
+        dict: {collection id: card data}
+    """
+    collection_ids = list(collection_ids)
+    cards = {}
+    for start in range(0, len(collection_ids), chunk_size):
+        collections = cards_queryset().filter(pk__in=collection_ids[start:start + chunk_size])
+        chunk = [CollectionCards(collection=collection, data=CollectionCardsSerializer(collection).data) for collection in collections]
+        CollectionCards.objects.bulk_create(
+            chunk,
+            update_conflicts=True,
+            unique_fields=["collection"],
+            update_fields=["data", "last_updated"],
+        )
+        cards.update({card.collection_id: card.data for card in chunk})
+    return cards
+
+def page_cards(collections):
+    """
+    the card of every collection in a page loaded with select_related('card'),
+    building the cards that don't exist yet
+    """
+    missing = [collection.pk for collection in collections if not hasattr(collection, "card")]
+    built = rebuild_cards(missing) if missing else {}
+    return [built[collection.pk] if collection.pk in built else collection.card.data for collection in collections]
+
+def changed_cards(rows):
+    """rebuild the cards of the queued (model, pk) rows, collections or their title/description Texts"""
+    collection_ids = [pk for model, pk in rows if model is Collections]
+    texts = [pk for model, pk in rows if model is Text]
+    if texts:
+        collection_ids += Collections.objects.filter(Q(title__in=texts) | Q(description__in=texts)).values_list("pk", flat=True)
+    rebuild_cards(dict.fromkeys(collection_ids))
+
+# (model, pk) of the rows written during the current transaction
+card_rebuilds = on_commit_batch(changed_cards, "collection cards")
+
+def rebuild_on_commit(collection_ids):
+    """rebuild the cards once the transaction commits, each card queued during a transaction once"""
+    card_rebuilds.add((Collections, pk) for pk in collection_ids)
+
+def referencing_collections(model, pk):
+    """ids of the collections whose cards show the authority record"""
+    collection_ids = set()
+    for relation in CARD_RELATIONS[model]:
+        field = Collections._meta.get_field(relation)
+        through = field.remote_field.through
+        collection_ids.update(through.objects.filter(
+            **{f"{field.m2m_reverse_field_name()}_id": pk}
+        ).values_list(f"{field.m2m_field_name()}_id", flat=True))
+    return collection_ids
+
+
+@receiver(post_save, sender=Collections)
+def collection_saved(sender, instance, **kwargs):
+    rebuild_on_commit([instance.pk])
+
+@receiver(m2m_changed, sender=Collections.collectors_persons.through)
+@receiver(m2m_changed, sender=Collections.collectors_orgs.through)
+@receiver(m2m_changed, sender=Collections.depositors_persons.through)
+@receiver(m2m_changed, sender=Collections.depositors_orgs.through)
+@receiver(m2m_changed, sender=Collections.collection_languages.through)
+@receiver(m2m_changed, sender=Collections.countries.through)
+def collection_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            rebuild_on_commit([instance.pk])
+    elif action in ("post_add", "post_remove"):
+        rebuild_on_commit(pk_set)
+    elif action == "pre_clear":
+        # the collections losing the record are only known before the clear
+        field = next(field for field in Collections._meta.many_to_many if field.remote_field.through is sender)
+        rebuild_on_commit(sender.objects.filter(
+            **{f"{field.m2m_reverse_field_name()}_id": instance.pk}
+        ).values_list(f"{field.m2m_field_name()}_id", flat=True))
+
+@receiver(post_save, sender=Text)
+def text_saved(sender, instance, created, **kwargs):
+    if not created:
+        # the collections showing it are looked up once per transaction, with the other queued rows
+        card_rebuilds.add([(Text, instance.pk)])
+
+@receiver(post_save, sender=Languages)
+@receiver(post_save, sender=Countries)
+@receiver(post_save, sender=Organizations)
+@receiver(post_save, sender=Persons)
+def authority_saved(sender, instance, created, **kwargs):
+    if created:
+        # nothing references a new record yet
+        return
+    rebuild_on_commit(referencing_collections(sender, instance.pk))
@@ -0,0 +1,196 @@
+import uuid
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.renderers import JSONRenderer
+
+from .deferred import on_commit_batch
+from .models import Collections, Folders, Items, File, Text
+from .authority_snapshots import TEXT_LANGUAGES
+
+"""
+The Collection -> Folders -> Items -> Files hierarchy of one collection as a single JSON document,
+for the tree endpoint.
+
+Every level is read with one values() query over the whole collection, its Text fields joined
+in, so a tree takes at most four queries whatever its size. depth stops the tree after folders (1),
+items (2) or files (3), and the profile picks the fields of each level:
+
+- minimal: ids and names only
+- summary: what the children endpoints return, plus a few item and file details
+
+The rendered bytes are cached per (collection, depth, profile) under a version token of the
+collection. Saves and deletes of the collection, its folders, items and files, or of a Text they
+show, replace the token once the transaction commits. The receivers only queue ids, the
+collections they belong to are looked up once per transaction, a query per kind of row.
+"""
+
+# fields shown at each level, Text fields like TextSerializer data and other relations as ids
+TREE_PROFILES = {
+    "minimal": {
+        Collections: ("id", "title"),
+        Folders: ("id", "title"),
+        Items: ("id", "name"),
+        File: ("id", "filename"),
+    },
+    "summary": {
+        Collections: ("id", "title", "description", "draft"),
+        Folders: ("id", "title", "description"),
+        Items: ("id", "name", "description", "visibility", "draft"),
+        File: ("id", "filename", "media_type", "content_type", "original_medium", "file_size", "extent"),
+    },
+}
+
+DEFAULT_PROFILE = "summary"
+MAX_DEPTH = 3
+
+# (model, key of its rows in the parent row, column holding the parent id, lookup to the collection)
+TREE_LEVELS = (
+    (Folders, "folders", "parent_collection_id", "parent_collection"),
+    (Items, "items", "parent_folder_id", "parent_folder__parent_collection"),
+    (File, "files", "parent_item_id", "parent_item__parent_folder__parent_collection"),
+)
+
+# old trees are orphaned by the version token, the timeout only frees their memory
+TREE_CACHE_TIMEOUT = 60 * 60
+
+def level_rows(queryset, fields, parent_column=None):
+    """
+    the rows of a queryset as dicts of the given fields, in id order
+
+    Returns:
+        list: (parent id, row) tuples, parent id is None without parent_column
+    """
+    model = queryset.model
+    columns = [] if parent_column is None else [parent_column]
+    kinds = []
+    for field in fields:
+        related_model = model._meta.get_field(field).related_model
+        if related_model is Text:
+            columns += [f"{field}_id", *(f"{field}__{language}" for language in TEXT_LANGUAGES)]
+            kinds.append((field, "text"))
+        elif related_model is not None:
+            columns.append(f"{field}_id")
+            kinds.append((field, "id"))
+        else:
+            columns.append(field)
+            kinds.append((field, "value"))
+
+    rows = []
+    for values in queryset.order_by("id").values_list(*columns):
+        position = 0 if parent_column is None else 1
+        row = {}
+        for field, kind in kinds:
+            if kind == "text":
+                text = values[position:position + 4]
+                row[field] = None if text[0] is None else {"id": text[0], "en": text[1], "es": text[2], "pt": text[3]}
+                position += 4
+            else:
+                row[field] = values[position]
+                position += 1
+        rows.append((values[0] if parent_column is not None else None, row))
+    return rows
+
+def build_tree(collection_id, depth=MAX_DEPTH, profile=DEFAULT_PROFILE):
+    """
+    the tree of a collection as a dict, None if the collection doesn't exist
+
+    Usage::
+
+        build_tree(12, depth=2, profile="minimal")
+    """
+    fields = TREE_PROFILES[profile]
+    found = level_rows(Collections.objects.filter(pk=collection_id), fields[Collections])
+    if not found:
+        return None
+    tree = found[0][1]
+
+    parents = {collection_id: tree}
+    for model, children_key, parent_column, collection_lookup in TREE_LEVELS[:depth]:
+        for parent in parents.values():
+            parent[children_key] = []
+
+        queryset = model.objects.filter(**{collection_lookup: collection_id})
+        children = {}
+        for parent_id, row in level_rows(queryset, fields[model], parent_column):
+            parents[parent_id][children_key].append(row)
+            children[row["id"]] = row
+        parents = children
+    return tree
+
+def tree_version(collection_id):
+    """token replaced whenever something the collection's tree shows changes"""
+    return cache.get_or_set(f"collection_tree_version_{collection_id}", lambda: uuid.uuid4().hex, timeout=None)
+
+def rendered_tree(collection_id, depth=MAX_DEPTH, profile=DEFAULT_PROFILE):
+    """the tree of a collection as JSON bytes, from the cache when it is current. None if the collection doesn't exist"""
+    cache_key = f"collection_tree_{collection_id}_{tree_version(collection_id)}_{depth}_{profile}"
+    content = cache.get(cache_key)
+    if content is None:
+        tree = build_tree(collection_id, depth, profile)
+        if tree is None:
+            return None
+        content = JSONRenderer().render(tree)
+        cache.set(cache_key, content, timeout=TREE_CACHE_TIMEOUT)
+    return content
+
+def invalidate_trees(collection_ids):
+    """orphans every cached tree of the collections"""
+    cache.delete_many([f"collection_tree_version_{pk}" for pk in collection_ids])
+
+def changed_collections(rows):
+    """the collections whose trees show the queued (model, pk) rows"""
+    pending = {Collections: set(), Folders: set(), Items: set(), Text: set()}
+    for model, pk in rows:
+        pending[model].add(pk)
+
+    collection_ids = set(pending[Collections])
+    collection_ids.update(Folders.objects.filter(pk__in=pending[Folders]).values_list("parent_collection_id", flat=True))
+    collection_ids.update(Items.objects.filter(pk__in=pending[Items]).values_list("parent_folder__parent_collection_id", flat=True))
+    if pending[Text]:
+        texts = pending[Text]
+        collection_ids.update(Collections.objects.filter(Q(title__in=texts) | Q(description__in=texts)).values_list("pk", flat=True))
+        collection_ids.update(Folders.objects.filter(Q(title__in=texts) | Q(description__in=texts)).values_list("parent_collection_id", flat=True))
+        collection_ids.update(Items.objects.filter(Q(name__in=texts) | Q(description__in=texts)).values_list("parent_folder__parent_collection_id", flat=True))
+    return collection_ids
+
+# (model, pk) of the rows written during the current transaction
+tree_invalidations = on_commit_batch(lambda rows: invalidate_trees(changed_collections(rows)), "collection trees")
+
+def invalidate_on_commit(model, pk):
+    """
+    queue the id of a row whose collection's trees are outdated, they are invalidated once the
+    transaction commits. A deleted row is queued by its parent, which still exists then or was
+    deleted too and queued its own parent
+    """
+    if pk is not None:
+        tree_invalidations.add([(model, pk)])
+
+
+@receiver(post_save, sender=Collections, dispatch_uid="collection_tree_collections")
+@receiver(post_delete, sender=Collections, dispatch_uid="collection_tree_collections_delete")
+def collection_changed(sender, instance, **kwargs):
+    invalidate_on_commit(Collections, instance.pk)
+
+@receiver(post_save, sender=Folders, dispatch_uid="collection_tree_folders")
+@receiver(post_delete, sender=Folders, dispatch_uid="collection_tree_folders_delete")
+def folder_changed(sender, instance, **kwargs):
+    invalidate_on_commit(Collections, instance.parent_collection_id)
+
+@receiver(post_save, sender=Items, dispatch_uid="collection_tree_items")
+@receiver(post_delete, sender=Items, dispatch_uid="collection_tree_items_delete")
+def item_changed(sender, instance, **kwargs):
+    invalidate_on_commit(Folders, instance.parent_folder_id)
+
+@receiver(post_save, sender=File, dispatch_uid="collection_tree_files")
+@receiver(post_delete, sender=File, dispatch_uid="collection_tree_files_delete")
+def file_changed(sender, instance, **kwargs):
+    invalidate_on_commit(Items, instance.parent_item_id)
+
+@receiver(post_save, sender=Text, dispatch_uid="collection_tree_texts")
+def text_saved(sender, instance, created, **kwargs):
+    if not created:
+        # a new Text isn't shown anywhere until the row using it is saved
+        invalidate_on_commit(Text, instance.pk)
@@ -10,21 +10,28 @@ from django_filters.rest_framework import DjangoFilterBackend
 from ailla.serializers_folders import SimpleFoldersSerializer
 from core.logger import logger
 from django.db import transaction
-from ailla.solr import solr
+from django.core.exceptions import ValidationError
+from ailla.solr import add_in_batches, delete_on_commit
+from django.utils import timezone
+from django.http import HttpResponse
 
 from core.logger import logger
-from .models import Collections, Text, Persons, Languages, Countries, Organizations, Folders, Items, File
+from .models import Collections, Text, Persons, Languages, Countries, Organizations, Folders, Items, File, CollectionJobs
 from .serializers import TextSerializer
-from .serializers_collections import CollectionsSerializer, CollectionsSolrSerializer
-from .serializers_folders import FoldersSolrSerializer
+from .serializers_collections import CollectionsSerializer, CollectionJobsSerializer
+from .jobs import run_in_background, record_progress
+from .collection_cards import page_cards
+from .collection_tree import TREE_PROFILES, DEFAULT_PROFILE, MAX_DEPTH, rendered_tree, invalidate_on_commit
+from .solr_documents import collection_document, folder_document, collection_documents_queryset, folder_documents_queryset, memoized_authorities
 
-from .pagination_utils import SmallResultsSetPagination
-from django.db.models import Q
+from .pagination_utils import SmallResultsSetPagination, CachedIdsMixin, bump_list_version
+from .text_search import search_filter
 from django.db.models.functions import Coalesce, Lower
-from django.core.cache import cache
 
 
-class CollectionsViewSet(viewsets.ModelViewSet):
+class CollectionsViewSet(CachedIdsMixin, viewsets.ModelViewSet):
+    cache_prefix = 'collections'
+    keyset_field = 'sorted_title'
     serializer_class = CollectionsSerializer
     pagination_class = SmallResultsSetPagination
     queryset = Collections.objects.all()
@@ -34,53 +41,35 @@ class CollectionsViewSet(viewsets.ModelViewSet):
         # Get the 'page_language' parameter from the query string, default to 'en' if not provided
         page_language = self.request.query_params.get('page_language', 'en')
         query = self.request.query_params.get('query', '')       
-        cache_key = f'collections_queryset_{page_language}_{query}'
-        queryset = cache.get(cache_key)
-
-        if queryset is None:
-            # Define a mapping between page_language codes and Collections title fields
-            page_language_field_mapping = {
-                'en': 'title__en_neutral',
-                'es': 'title__es_neutral',
-                'pt': 'title__pt_neutral',
-            }
-            
-            # Get the appropriate field name for sorting based on the passed page_language
-            order_field = page_language_field_mapping.get(page_language, 'title__en_neutral')
-
-            # Fallback to English neutral if the specified page_language title is empty
-            queryset = Collections.objects.annotate(
-                sorted_title=Coalesce(order_field, 'title__en_neutral')
-            ).select_related(
-                'title',
-                'description',
-                'lang_indigenous_title',
-                'lang_indigenous_description'
-            ).prefetch_related(
-                Prefetch('collectors_persons', queryset=Persons.objects.only('id', 'given_name', 'surname')),
-                Prefetch('collectors_orgs', queryset=Organizations.objects.select_related('org_name')),
-                Prefetch('depositors_persons', queryset=Persons.objects.only('id', 'given_name', 'surname')),
-                Prefetch('depositors_orgs', queryset=Organizations.objects.select_related('org_name')),
-                Prefetch('collection_languages', queryset=Languages.objects.select_related('name')),
-                Prefetch('countries', queryset=Countries.objects.select_related('name')),
-            ).filter(
-                Q(id__icontains=query) |
-                Q(title__en__icontains=query) |
-                Q(title__es__icontains=query) |
-                Q(title__pt__icontains=query) |
-                Q(title__en_neutral__icontains=query) |
-                Q(title__es_neutral__icontains=query) |
-                Q(title__pt_neutral__icontains=query)
-            ).order_by(Lower('sorted_title'))
-            
-            cache.set(cache_key, queryset, timeout=300)
-        
+
+        queryset = collections_list_queryset(page_language, query).select_related(
+            'title',
+            'description',
+            'lang_indigenous_title',
+            'lang_indigenous_description'
+        ).prefetch_related(
+            Prefetch('collectors_persons', queryset=Persons.objects.only('id', 'given_name', 'surname')),
+            Prefetch('collectors_orgs', queryset=Organizations.objects.select_related('org_name')),
+            Prefetch('depositors_persons', queryset=Persons.objects.only('id', 'given_name', 'surname')),
+            Prefetch('depositors_orgs', queryset=Organizations.objects.select_related('org_name')),
+            Prefetch('collection_languages', queryset=Languages.objects.select_related('name')),
+            Prefetch('countries', queryset=Countries.objects.select_related('name')),
+        )
+
         return queryset
     
+    @action(detail=False, methods=['GET'])
+    def cards(self, request):
+        """a page of published collections as precomputed list cards, read with the page query"""
+        page_language = request.query_params.get('page_language', 'en')
+        query = request.query_params.get('query', '')
+        queryset = collections_list_queryset(page_language, query).filter(draft=False).select_related('card')
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(page_cards(page))
+
     @action(detail=False, methods=['GET'])
     def get_published(self, request):
-        queryset = self.get_queryset().filter(draft=False)
-        page = self.paginate_queryset(queryset)  # Paginate the queryset
+        page = self.paginate_queryset(self.cached_rows(draft=False))  # Paginate the cached ids
         serialized_data = CollectionsSerializer(page, many=True).data
         return self.get_paginated_response(serialized_data)
     
@@ -144,45 +133,196 @@ class CollectionsViewSet(viewsets.ModelViewSet):
         folders = Collections.objects.get(pk=pk).folders.all().select_related('title', 'description')
         return Response(SimpleFoldersSerializer(folders, many=True).data, status=status.HTTP_200_OK)
 
+    @action(detail=True, methods=['get'])
+    def tree(self, request: Request, pk):
+        """the collection with its folders, items and files nested in one response, read with a
+        query per level and cached until one of them changes
+
+        Query parameters:
+            depth: 0 for the collection alone, 1 down to folders, 2 to items, 3 (default) to files
+            profile: minimal (ids and names) or summary (default)
+
+        Returns:
+            json: the collection, with "folders", each with "items", each with "files" + http 200
+        """
+        try:
+            collection_id = int(pk)
+        except ValueError:
+            return Response({'message': 'collection not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            depth = int(request.query_params.get('depth', MAX_DEPTH))
+        except ValueError:
+            return Response({'error': 'Invalid depth parameter'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 <= depth <= MAX_DEPTH:
+            return Response({'error': 'Invalid depth parameter'}, status=status.HTTP_400_BAD_REQUEST)
+
+        profile = request.query_params.get('profile', DEFAULT_PROFILE)
+        if profile not in TREE_PROFILES:
+            return Response({'error': 'Invalid profile parameter'}, status=status.HTTP_400_BAD_REQUEST)
+
+        content = rendered_tree(collection_id, depth, profile)
+        if content is None:
+            return Response({'message': 'collection not found'}, status=status.HTTP_404_NOT_FOUND)
+        # already rendered JSON, sent as is
+        return HttpResponse(content, content_type='application/json')
+
     @action(detail=True, methods=['post'])
     def publish(self, request: Request, pk=None):
+        """starts publishing the collection in the background
+
+        Returns:
+            json: the job, whose progress can be followed with jobs/<id> + http 202
+        """
         # if not is_admin_or_superadmin(request.user):
         #     return Response({"detail": "Only admins or superadmins can publish this collection."}, status=status.HTTP_403_FORBIDDEN)
 
-        # Change DRAFT on Collection to False
         collection = self.get_object()
-        collection.draft = False
-        collection.save()
+        job = start_collection_job(CollectionJobs.JobTypes.PUBLISH, collection, request.user)
+        return Response(CollectionJobsSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['post'])
+    def unpublish(self, request: Request, pk=None):
+        """starts returning the collection to draft in the background, removing it from Solr
+
+        Returns:
+            json: the job, whose progress can be followed with jobs/<id> + http 202
+        """
+        # if not is_admin_or_superadmin(request.user):
+        #     return Response({"detail": "Only admins or superadmins can unpublish this collection."}, status=status.HTTP_403_FORBIDDEN)
+
+        collection = self.get_object()
+        job = start_collection_job(CollectionJobs.JobTypes.UNPUBLISH, collection, request.user)
+        return Response(CollectionJobsSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'], url_path=r'jobs/(?P<job_id>[^/.]+)')
+    def job(self, request: Request, job_id=None):
+        """progress of a publish or unpublish job"""
+        try:
+            job = CollectionJobs.objects.get(id=job_id)
+        except (CollectionJobs.DoesNotExist, ValidationError):
+            return Response({'message': 'job not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(CollectionJobsSerializer(job).data, status=status.HTTP_200_OK)
+
+
+def collections_list_queryset(page_language='en', query=''):
+    """Collections matching the query on id or title, sorted by title in the page language"""
+    # Define a mapping between page_language codes and Collections title fields
+    page_language_field_mapping = {
+        'en': 'title__en_neutral',
+        'es': 'title__es_neutral',
+        'pt': 'title__pt_neutral',
+    }
+    
+    # Get the appropriate field name for sorting based on the passed page_language
+    order_field = page_language_field_mapping.get(page_language, 'title__en_neutral')
+
+    # Fallback to English neutral if the specified page_language title is empty
+    return Collections.objects.annotate(
+        sorted_title=Coalesce(order_field, 'title__en_neutral')
+    ).filter(
+        search_filter(query, "title")
+    ).order_by(Lower('sorted_title'))
+
+def start_collection_job(job_type, collection, user=None):
+    """creates a publish or unpublish job for the collection and queues it"""
+    total = 1 + Folders.objects.filter(parent_collection=collection).count() \
+        + Items.objects.filter(parent_folder__parent_collection=collection).count() \
+        + File.objects.filter(parent_item__parent_folder__parent_collection=collection).count()
+
+    job = CollectionJobs.objects.create(
+        job_type=job_type,
+        collection=collection,
+        user=user if user is not None and user.is_authenticated else None,
+        total=total,
+    )
+
+    def publish_task(job):
+        publish_collection(job.collection_id, on_batch=lambda count, error: record_progress(job, count, error))
+
+    def unpublish_task(job):
+        unpublish_collection(job.collection_id)
+        record_progress(job, job.total)
+
+    run_in_background(job, publish_task if job_type == CollectionJobs.JobTypes.PUBLISH else unpublish_task)
+    return job
+
+def publish_collection(collection_id, batch_size=500, on_batch=None):
+    """Publishes a collection with all of its folders and items, then adds them to Solr.
+
+    DRAFT is flipped with one UPDATE per level, and the Solr documents are sent in
+    batches of batch_size once the transaction has committed. on_batch is passed on to add_in_batches.
+    """
+    with transaction.atomic():
+        Collections.objects.filter(id=collection_id).update(draft=False)
+        Folders.objects.filter(parent_collection=collection_id).update(draft=False)
+        # update() skips auto_now, set it like save() used to
+        Items.objects.filter(parent_folder__parent_collection=collection_id).update(draft=False, last_updated=timezone.now())
+        # update() sends no signals, the trees and the published lists show draft
+        invalidate_on_commit(Collections, collection_id)
+        bump_list_version(Collections)
+        bump_list_version(Items)
+
+        transaction.on_commit(lambda: add_in_batches(collection_solr_documents(collection_id), batch_size=batch_size, on_batch=on_batch))
+
+def unpublish_collection(collection_id):
+    """Returns a collection with all of its folders and items to draft, and removes the collection,
+    folder, item and file documents from Solr with a single delete-by-id once the transaction has committed.
+    """
+    with transaction.atomic():
+        Collections.objects.filter(id=collection_id).update(draft=True)
+        Folders.objects.filter(parent_collection=collection_id).update(draft=True)
+        Items.objects.filter(parent_folder__parent_collection=collection_id).update(draft=True, last_updated=timezone.now())
+        # update() sends no signals, the trees and the published lists show draft
+        invalidate_on_commit(Collections, collection_id)
+        bump_list_version(Collections)
+        bump_list_version(Items)
 
-        # Add to Solr
-        solr_data = []
-        collection_data = CollectionsSolrSerializer(collection).data
-        solr_data.append(collection_data)
+        # by id, like Collections.delete()
+        delete_on_commit(Collections.objects.get(id=collection_id).get_cascade_solr_ids())
 
-        folders = Folders.objects.filter(parent_collection=collection.id)
-        if folders:
-            for folder in folders:
-                folder.draft = False
-                folder.save()
+def collection_solr_documents(collection_id, chunk_size=100):
+    """Yields the Solr documents for a collection and everything in it.
 
-                folder_data = FoldersSolrSerializer(folder).data
-                solr_data.append(folder_data)
+    Folders are loaded chunk_size at a time, each chunk with its items and files
+    prefetched, so the number of queries doesn't depend on the number of items.
+    """
+    language = Languages.objects.select_related('name')
 
-                items = Items.objects.filter(parent_folder=folder.id)
-                if items:
-                    for item in items:
-                        item.draft = False
-                        item.save()
+    collection = collection_documents_queryset().get(id=collection_id)
+    yield collection_document(collection)
 
-                        item_data = ItemsSolrSerializer(item).data
-                        solr_data.append(item_data)
+    files = File.objects.select_related(
+        'content_type__name',
+        'original_medium__name',
+    ).prefetch_related(
+        Prefetch('media_language', queryset=language),
+        'rights_statements__title',
+        'rights_statements__uri',
+    )
+    items = Items.objects.select_related(
+        'name',
+        'description',
+        'lang_indigenous_name__name',
+        'lang_indigenous_description__name',
+    ).prefetch_related(
+        'genre__name',
+        'contributorrole_set__person',
+        'contributorrole_set__organization__org_name',
+        'contributorrole_set__role_name__name',
+        Prefetch('files', queryset=files),
+    )
+    folders = folder_documents_queryset().filter(parent_collection=collection_id).prefetch_related(
+        Prefetch('items', queryset=items),
+    ).order_by('id')
 
-                        files = File.objects.filter(parent_item=item.id)
-                        if files:
-                            for file in files:
-                                file_data = FilesSolrSerializer(file).data
-                                solr_data.append(file_data)
+    # folders of a collection mostly share their languages and countries
+    with memoized_authorities():
+        for folder in folders.iterator(chunk_size=chunk_size):
+            yield folder_document(folder)
 
-        solr.add(solr_data)
+            for item in folder.items.all():
+                yield ItemsSolrSerializer(item).data
 
-        return Response(CollectionsSerializer(collection).data, status=status.HTTP_200_OK)
\ No newline at end of file
+                for file in item.files.all():
+                    yield FilesSolrSerializer(file).data
@@ -1,12 +1,34 @@
 
-from rest_framework import viewsets, status, serializers
+from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from .models import MediaContentType, Genre, ParticipantRoles, OriginalMediaType
-from .serializers import MediaContentTypeSerializer, GenreSerializer, ParticipantRolesSerializer, OriginalMediaTypeSerializer, TextSerializer
-from django.db.models import Q
+from .serializers import MediaContentTypeSerializer, GenreSerializer, ParticipantRolesSerializer, OriginalMediaTypeSerializer
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
-
+from .authority_snapshots import VOCABULARY_FIELDS, media_content_types_snapshot, genres_snapshot, participant_roles_snapshot, original_media_types_snapshot
+from .autosuggest import media_content_types_autosuggest, genres_autosuggest, participant_roles_autosuggest, original_media_types_autosuggest
+
+
+def vocabulary_response(request, snapshot, key, build):
+    """
+    build()'s data as JSON rendered once per snapshot load, with an ETag. A request whose
+    If-None-Match has it gets a 304 without a body, answered without the database or a serializer
+    """
+    etag, content = snapshot.rendered(key, build)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    return response
+
+def original_media_types_named(word):
+    """the original media types with word in their English name, case insensitive like name__en__icontains"""
+    return [
+        data for data in original_media_types_snapshot.serialize_all(VOCABULARY_FIELDS)
+        if word in (data["name"]["en"] or "").casefold()
+    ]
 
 
 class MediaContentTypesViewSet(viewsets.ModelViewSet):
@@ -56,21 +78,7 @@ class MediaContentTypesViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def all(self, request):
-
-        media_content_type = MediaContentType.objects.select_related('name', 'description').all()
-
-        class MediaContentTypeAllSerializer(serializers.ModelSerializer):
-            name = TextSerializer()
-            description = TextSerializer()
-
-            class Meta:
-                model = MediaContentType
-                fields = ('id', 'name', 'description')
-
-        serializer = MediaContentTypeAllSerializer(media_content_type, many=True)
-        media_content_type_data = serializer.data
-
-        return Response(media_content_type_data, status=status.HTTP_200_OK)
+        return vocabulary_response(request, media_content_types_snapshot, 'all', lambda: media_content_types_snapshot.serialize_all(VOCABULARY_FIELDS))
         
     @action(detail=False, methods=['get'])
     def autosuggest(self, request):
@@ -83,23 +91,7 @@ class MediaContentTypesViewSet(viewsets.ModelViewSet):
         except ValueError:
             return Response({'error': 'Invalid limit parameter'}, status=status.HTTP_400_BAD_REQUEST)
 
-        mediaContentTypes = MediaContentType.objects.select_related('name', 'description').filter(
-            Q(id__icontains=query) | 
-            Q(name__en__icontains=query) | 
-            Q(name__es__icontains=query) | 
-            Q(name__pt__icontains=query)
-        )[:limit]
-
-        class MediaContentTypeAutosuggestSerializer(serializers.ModelSerializer):
-            name = TextSerializer()
-            description = TextSerializer()
-
-            class Meta:
-                model = MediaContentType
-                fields = ('id', 'name', 'description')
-
-        serializer = MediaContentTypeAutosuggestSerializer(mediaContentTypes, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(media_content_types_autosuggest.search(query, limit), status=status.HTTP_200_OK)
 
 class GenreViewSet(viewsets.ModelViewSet):
     depth = 0
@@ -148,20 +140,7 @@ class GenreViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def all(self, request):
-        genre_list = Genre.objects.select_related('name', 'description').all()
-
-        class GenreAllSerializer(serializers.ModelSerializer):
-            name = TextSerializer()
-            description = TextSerializer()
-
-            class Meta:
-                model = Genre
-                fields = ('id', 'name', 'description')
-
-        serializer = GenreAllSerializer(genre_list, many=True)
-        genre_data = serializer.data
-
-        return Response(genre_data, status=status.HTTP_200_OK)
+        return vocabulary_response(request, genres_snapshot, 'all', lambda: genres_snapshot.serialize_all(VOCABULARY_FIELDS))
     
     @action(detail=False, methods=['get'])
     def autosuggest(self, request):
@@ -174,23 +153,7 @@ class GenreViewSet(viewsets.ModelViewSet):
         except ValueError:
             return Response({'error': 'Invalid limit parameter'}, status=status.HTTP_400_BAD_REQUEST)
 
-        genres = Genre.objects.select_related('name','description').filter(
-            Q(id__icontains=query) | 
-            Q(name__en__icontains=query) | 
-            Q(name__es__icontains=query) | 
-            Q(name__pt__icontains=query)
-        )[:limit]
-
-        class GenreAutosuggestSerializer(serializers.ModelSerializer):
-            name = TextSerializer()
-            description = TextSerializer()
-
-            class Meta:
-                model = Genre
-                fields = ('id', 'name', 'description')
-
-        serializer = GenreAutosuggestSerializer(genres, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(genres_autosuggest.search(query, limit), status=status.HTTP_200_OK)
     
 class ParticipantRolesViewSet(viewsets.ModelViewSet):
     depth = 0
@@ -241,21 +204,7 @@ class ParticipantRolesViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def all(self, request):
-        participant_roles = ParticipantRoles.objects.select_related('name', 'description').all()
-
-        class ParticipantRolesAllSerializer(serializers.ModelSerializer):
-            name = TextSerializer()
-            description = TextSerializer()
-
-            class Meta:
-                model = ParticipantRoles
-                fields = ('id', 'name', 'description')
-
-        serializer = ParticipantRolesAllSerializer(participant_roles, many=True)
-        participant_roles_data = serializer.data
-
-
-        return Response(participant_roles_data, status=status.HTTP_200_OK)
+        return vocabulary_response(request, participant_roles_snapshot, 'all', lambda: participant_roles_snapshot.serialize_all(VOCABULARY_FIELDS))
         
     @action(detail=False, methods=['get'])
     def autosuggest(self, request):
@@ -268,23 +217,7 @@ class ParticipantRolesViewSet(viewsets.ModelViewSet):
         except ValueError:
             return Response({'error': 'Invalid limit parameter'}, status=status.HTTP_400_BAD_REQUEST)
 
-        participantRoles = ParticipantRoles.objects.select_related('name', 'description').filter(
-            Q(id__icontains=query) | 
-            Q(name__en__icontains=query) | 
-            Q(name__es__icontains=query) | 
-            Q(name__pt__icontains=query)
-        )[:limit]
-
-        class ParticipantRolesAutosuggestSerializer(serializers.ModelSerializer):
-            name = TextSerializer()
-            description = TextSerializer()
-
-            class Meta:
-                model = ParticipantRoles
-                fields = ('id', 'name', 'description')
-
-        serializer = ParticipantRolesAutosuggestSerializer(participantRoles, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(participant_roles_autosuggest.search(query, limit), status=status.HTTP_200_OK)
 
 class OriginalMediaTypeViewSet(viewsets.ModelViewSet):
     depth = 0
@@ -334,81 +267,23 @@ class OriginalMediaTypeViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def all(self, request):
-        original_media_type = OriginalMediaType.objects.select_related('name', 'description').all()
-
-        class OriginalMediaTypeAllSerializer(serializers.ModelSerializer):
-            name = TextSerializer()
-            description = TextSerializer()
-
-            class Meta:
-                model = OriginalMediaType
-                fields = ('id', 'name', 'description')
-
-        serializer = OriginalMediaTypeAllSerializer(original_media_type, many=True)
-        original_media_type_data = serializer.data
-
-
-        return Response(original_media_type_data, status=status.HTTP_200_OK)
+        return vocabulary_response(request, original_media_types_snapshot, 'all', lambda: original_media_types_snapshot.serialize_all(VOCABULARY_FIELDS))
     
     @action(detail=False, methods=['get'])
     def audio(self, request):
-        original_media_type = OriginalMediaType.objects.filter(name__en__icontains='audio').select_related('name', 'description').all()
-
-        class OriginalMediaTypeAllSerializer(serializers.ModelSerializer):
-            name = TextSerializer()
-            description = TextSerializer()
-
-            class Meta:
-                model = OriginalMediaType
-                fields = ('id', 'name', 'description')
-
-        serializer = OriginalMediaTypeAllSerializer(original_media_type, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return vocabulary_response(request, original_media_types_snapshot, 'audio', lambda: original_media_types_named('audio'))
     
     @action(detail=False, methods=['get'])
     def image(self, request):
-        original_media_type = OriginalMediaType.objects.filter(name__en__icontains='image').select_related('name', 'description').all()
-
-        class OriginalMediaTypeAllSerializer(serializers.ModelSerializer):
-            name = TextSerializer()
-            description = TextSerializer()
-
-            class Meta:
-                model = OriginalMediaType
-                fields = ('id', 'name', 'description')
-
-        serializer = OriginalMediaTypeAllSerializer(original_media_type, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return vocabulary_response(request, original_media_types_snapshot, 'image', lambda: original_media_types_named('image'))
     
     @action(detail=False, methods=['get'])
     def text(self, request):
-        original_media_type = OriginalMediaType.objects.filter(name__en__icontains='text').select_related('name', 'description').all()
-
-        class OriginalMediaTypeAllSerializer(serializers.ModelSerializer):
-            name = TextSerializer()
-            description = TextSerializer()
-
-            class Meta:
-                model = OriginalMediaType
-                fields = ('id', 'name', 'description')
-
-        serializer = OriginalMediaTypeAllSerializer(original_media_type, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return vocabulary_response(request, original_media_types_snapshot, 'text', lambda: original_media_types_named('text'))
     
     @action(detail=False, methods=['get'])
     def video(self, request):
-        original_media_type = OriginalMediaType.objects.filter(name__en__icontains='video').select_related('name', 'description').all()
-
-        class OriginalMediaTypeAllSerializer(serializers.ModelSerializer):
-            name = TextSerializer()
-            description = TextSerializer()
-
-            class Meta:
-                model = OriginalMediaType
-                fields = ('id', 'name', 'description')
-
-        serializer = OriginalMediaTypeAllSerializer(original_media_type, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return vocabulary_response(request, original_media_types_snapshot, 'video', lambda: original_media_types_named('video'))
     
     @action(detail=False, methods=['get'])
     def autosuggest(self, request):
@@ -421,21 +296,5 @@ class OriginalMediaTypeViewSet(viewsets.ModelViewSet):
         except ValueError:
             return Response({'error': 'Invalid limit parameter'}, status=status.HTTP_400_BAD_REQUEST)
 
-        originalMediaTypes = OriginalMediaType.objects.select_related('name', 'description').filter(
-            Q(id__icontains=query) | 
-            Q(name__en__icontains=query) | 
-            Q(name__es__icontains=query) | 
-            Q(name__pt__icontains=query)
-        )[:limit]
-
-        class OriginalMediaTypeAutosuggestSerializer(serializers.ModelSerializer):
-            name = TextSerializer()
-            description = TextSerializer()
-
-            class Meta:
-                model = OriginalMediaType
-                fields = ('id', 'name', 'description')
-
-        serializer = OriginalMediaTypeAutosuggestSerializer(originalMediaTypes, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(original_media_types_autosuggest.search(query, limit), status=status.HTTP_200_OK)
 
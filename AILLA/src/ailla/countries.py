@@ -1,17 +1,22 @@
-from rest_framework import viewsets, status, serializers
+from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from .models import Countries, Collections
-from .serializers import CountriesSerializer, TextSerializer
-from django.db.models import Q
+from .serializers import CountriesSerializer
+from .serializers_collections import SimpleCollectionsSerializer
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
-from .pagination_utils import SmallResultsSetPagination
+from .pagination_utils import SmallResultsSetPagination, CachedIdsMixin, sorted_by_text
+from .text_search import search_filter
+from .exports import EXPORT_FORMATS, streaming_export
+from .authority_snapshots import countries_snapshot
+from .autosuggest import countries_autosuggest
 from django.db.models.functions import Coalesce, Lower
-from django.core.cache import cache
 
 import json
 
-class CountriesViewSet(viewsets.ModelViewSet):
+class CountriesViewSet(CachedIdsMixin, viewsets.ModelViewSet):
+    cache_prefix = 'countries'
+    keyset_field = 'sorted_name'
     queryset = Countries.objects.all()
     serializer_class = CountriesSerializer
     pagination_class = SmallResultsSetPagination
@@ -21,37 +26,26 @@ class CountriesViewSet(viewsets.ModelViewSet):
         # Get the 'lang' parameter from the query string, default to 'en' if not provided
         page_language = self.request.query_params.get('page_language', 'en')
         query = self.request.query_params.get('query', '')
-        cache_key = f'countries_queryset_{page_language}_{query}'
-        queryset = cache.get(cache_key)
-        if queryset is None:
-            # Define a mapping between page_language codes and model fields
-            page_language_field_mapping = {
-                'en': 'name__en_neutral',
-                'es': 'name__es_neutral',
-                'pt': 'name__pt_neutral',
-            }
-            
-            # Get the appropriate field name for sorting based on the passed page_language
-            order_field = page_language_field_mapping.get(page_language, 'name__en_neutral')
-            
-            # Fallback to English if the specified page_language name is empty
-            queryset = Countries.objects.annotate(
-                sorted_name=Coalesce(order_field, 'name__en_neutral')
-            ).select_related(
-                'name',
-            ).filter(
-                Q(id__icontains=query) | 
-                Q(name__en__icontains=query) | 
-                Q(name__es__icontains=query) | 
-                Q(name__pt__icontains=query) |
-                Q(name__en_neutral__icontains=query) | 
-                Q(name__es_neutral__icontains=query) | 
-                Q(name__pt_neutral__icontains=query) |
-                Q(country_code__icontains=query)
-            ).order_by(Lower('sorted_name'))
-
-            cache.set(cache_key, queryset, timeout=300)
+
+        # Define a mapping between page_language codes and model fields
+        page_language_field_mapping = {
+            'en': 'name__en_neutral',
+            'es': 'name__es_neutral',
+            'pt': 'name__pt_neutral',
+        }
+        
+        # Get the appropriate field name for sorting based on the passed page_language
+        order_field = page_language_field_mapping.get(page_language, 'name__en_neutral')
         
+        # Fallback to English if the specified page_language name is empty
+        queryset = Countries.objects.annotate(
+            sorted_name=Coalesce(order_field, 'name__en_neutral')
+        ).select_related(
+            'name',
+        ).filter(
+            search_filter(query, "name", "country_code")
+        ).order_by(Lower('sorted_name'))
+
         return queryset
     
     def create(self, request, *args, **kwargs):
@@ -86,44 +80,37 @@ class CountriesViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def all(self, request):
-        cache_key = 'countries_all'
-        countries_data = cache.get(cache_key)
-
-        if countries_data is None:
-            countries = Countries.objects.all().select_related('name')
-
-            class CountriesAllSerializer(serializers.ModelSerializer):
-                name = TextSerializer(required=False)
-                class Meta:
-                    model = Countries
-                    fields = ('id', 'name', 'country_code', 'flag_code')
-
-            serializer = CountriesAllSerializer(countries, many=True)
-            countries_data = serializer.data
-
-            cache.set(cache_key, countries_data, timeout=300)
-
-        return Response(countries_data, status=status.HTTP_200_OK)
+        return Response(countries_snapshot.serialize_all(('id', 'name', 'country_code', 'flag_code')), status=status.HTTP_200_OK)
     
     @action(detail=False, methods=['get'])
     def download(self, request):
         queryset = self.get_queryset()  # Get the unpaginated queryset
+        file_format = request.query_params.get('file_format')
+
+        # csv, jsonl and xlsx are streamed in chunks, without file_format the whole list is returned as JSON
+        if file_format is not None:
+            if file_format not in EXPORT_FORMATS:
+                return Response({'error': 'Invalid file_format parameter'}, status=status.HTTP_400_BAD_REQUEST)
+            return streaming_export(queryset, CountriesSerializer, file_format, 'countries')
+
         serializer = CountriesSerializer(queryset, many=True)  # Serialize the data
         return Response(serializer.data)  # Return the serialized data
     
     @action(detail=True, methods=['get'])
     def collections(self, request, pk=None):
-        try:
-            country = Countries.objects.get(pk=pk)
-            collections = Collections.objects.filter(
-                Q(countries=country),
-                draft=False
-            ).select_related('title', 'description')
-            
-            return Response(SimpleCollectionsSerializer(collections, many=True).data, status=status.HTTP_200_OK)
-        except Countries.DoesNotExist:
+        """a page of the published collections of the country, sorted by title"""
+        if not Countries.objects.filter(pk=pk).exists():
             return Response({'message': 'country not found'}, status=status.HTTP_404_NOT_FOUND)
-    
+
+        collections = Collections.objects.filter(
+            countries=pk,
+            draft=False
+        ).select_related('title', 'description')
+
+        page_language = request.query_params.get('page_language', 'en')
+        page = self.paginate_queryset(sorted_by_text(collections, 'title', page_language))
+        return self.get_paginated_response(SimpleCollectionsSerializer(page, many=True).data)
+
     @action(detail=False, methods=['get'])
     def autosuggest(self, request):
         query = request.query_params.get('query', None)
@@ -135,25 +122,6 @@ class CountriesViewSet(viewsets.ModelViewSet):
         except ValueError:
             return Response({'error': 'Invalid limit parameter'}, status=status.HTTP_400_BAD_REQUEST)
 
-        countries = Countries.objects.select_related('name').filter(
-            Q(id__icontains=query) | 
-            Q(name__en__icontains=query) | 
-            Q(name__es__icontains=query) | 
-            Q(name__pt__icontains=query) |
-            Q(name__en_neutral__icontains=query) | 
-            Q(name__es_neutral__icontains=query) | 
-            Q(name__pt_neutral__icontains=query) |
-            Q(country_code__icontains=query)
-        )[:limit]
-
-        class CountriesAutosuggestSerializer(serializers.ModelSerializer):
-            name = TextSerializer()
-
-            class Meta:
-                model = Countries
-                fields = ('id', 'name', 'flag_code', 'country_code')
-
-        serializer = CountriesAutosuggestSerializer(countries, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(countries_autosuggest.search(query, limit), status=status.HTTP_200_OK)
     
     
\ No newline at end of file
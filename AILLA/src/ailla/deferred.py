@@ -0,0 +1,71 @@
+import threading
+
+from django.db import transaction
+
+from core.logger import logger
+
+"""
+Work collected during a transaction and done once after it commits.
+
+Signal receivers run once per saved or deleted row. When they only need to say "this changed",
+they add keys to an on_commit_batch instead of scheduling their own work, and the batch hands
+every key collected during the transaction to a single flush call after commit.
+"""
+
+class on_commit_batch:
+    """
+    keys added during a transaction, passed together to flush(keys) once it commits.
+    Outside a transaction flush runs right away, like transaction.on_commit
+
+    A batch is scheduled with a single on_commit callback. When that callback was dropped by a
+    rollback, or already ran, the next key starts a new batch, so rolled back keys are never flushed.
+    Keys added inside a savepoint go to a batch of their own, dropped with the savepoint like any
+    on_commit callback registered in it.
+    Errors are logged, a failing flush doesn't stop the other callbacks.
+
+    Usage::
+
+        card_rebuilds = on_commit_batch(rebuild_cards, "collection cards")
+        card_rebuilds.add([collection.pk])
+    """
+    def __init__(self, flush, name):
+        self.flush = flush
+        self.name = name
+        self.pending = threading.local()
+
+    def scheduled(self):
+        """the keys of the current batch, None when its callback isn't waiting for this commit and savepoint"""
+        batch = getattr(self.pending, "batch", None)
+        if batch is None:
+            return None
+        keys, callback = batch
+        connection = transaction.get_connection()
+        savepoints = set(connection.savepoint_ids)
+        if connection.in_atomic_block and any(hook[1] is callback and hook[0] == savepoints for hook in connection.run_on_commit):
+            return keys
+        return None
+
+    def add(self, keys):
+        keys = list(keys)
+        if not keys:
+            return
+
+        queued = self.scheduled()
+        if queued is not None:
+            queued.update(dict.fromkeys(keys))
+            return
+
+        # a dict keeps the keys in the order they were added
+        queued = dict.fromkeys(keys)
+        def callback():
+            self.run(queued)
+        self.pending.batch = (queued, callback)
+        transaction.on_commit(callback)
+
+    def run(self, queued):
+        keys = list(queued)
+        queued.clear()
+        try:
+            self.flush(keys)
+        except Exception as e:
+            logger.error(f"Error updating {self.name} after commit: {e}")
@@ -0,0 +1,143 @@
+import csv
+import json
+import tempfile
+from itertools import islice
+
+from django.http import StreamingHttpResponse
+from openpyxl import Workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from rest_framework import serializers
+from rest_framework.utils.encoders import JSONEncoder
+
+"""
+Streaming exports of a queryset as CSV, JSONL or XLSX, used by the `download` actions.
+
+Rows are read with queryset.iterator(chunk_size), so prefetches run per chunk and only one chunk
+of model instances is in memory at a time. Each chunk is serialized with the endpoint's serializer
+(many=True, much faster than one serializer per row) and written out before the next is read.
+
+- jsonl: one serializer output per line, exactly what the JSON download returns per record
+- csv: one column per serializer field, nested records (like a Text name) spread over
+  <field>_<child> columns, lists of ids joined with "; ", lists of records as JSON
+- xlsx: the csv columns, written with openpyxl's write-only workbook, which keeps rows on disk.
+  A zip archive can only be sent once it is complete, so XLSX bytes start after the last row
+
+csv and xlsx text cells drop the control characters xlsx can't hold, and text a spreadsheet would
+run as a formula (starting with =, +, -, @, tab or carriage return) is prefixed with a quote.
+"""
+
+EXPORT_CHUNK_SIZE = 2000
+
+# bytes per chunk when sending a finished XLSX file
+FILE_CHUNK_SIZE = 64 * 1024
+
+def serialized_rows(queryset, serializer_class, chunk_size=EXPORT_CHUNK_SIZE):
+    """serializer output for every row of the queryset, one chunk in memory at a time"""
+    objects = queryset.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(objects, chunk_size))
+        if not chunk:
+            return
+        yield from serializer_class(chunk, many=True).data
+
+def columns(serializer, prefix=""):
+    """flat column names of a serializer, nested serializers spread over prefixed columns"""
+    names = []
+    for name, field in serializer.fields.items():
+        if isinstance(field, serializers.Serializer):
+            names += columns(field, f"{prefix}{name}_")
+        else:
+            names.append(f"{prefix}{name}")
+    return names
+
+# first characters that make a spreadsheet read a cell as a formula
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+def text_cell(text:str):
+    """text as a csv/xlsx cell that is shown as written, never run as a formula"""
+    text = ILLEGAL_CHARACTERS_RE.sub("", text)
+    if text.startswith(FORMULA_PREFIXES):
+        return f"'{text}"
+    return text
+
+def cell(value):
+    """a serializer value as one csv/xlsx cell"""
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        if all(not isinstance(item, (dict, list)) for item in value):
+            return text_cell("; ".join(str(item) for item in value))
+        return text_cell(json.dumps(value, cls=JSONEncoder, ensure_ascii=False))
+    if isinstance(value, dict):
+        return text_cell(json.dumps(value, cls=JSONEncoder, ensure_ascii=False))
+    if isinstance(value, (bool, int, float)):
+        return value
+    return text_cell(str(value))
+
+def flat_row(serializer, data):
+    """one serializer output as a list of cells in columns() order"""
+    row = []
+    for name, field in serializer.fields.items():
+        value = data.get(name)
+        if isinstance(field, serializers.Serializer):
+            row += flat_row(field, value) if value is not None else [""] * len(columns(field))
+        else:
+            row.append(cell(value))
+    return row
+
+
+class echo_buffer:
+    """a file-like object that hands back what is written, for csv.writer in a generator"""
+    def write(self, value):
+        return value
+
+def jsonl_lines(rows):
+    for data in rows:
+        yield json.dumps(data, cls=JSONEncoder, ensure_ascii=False) + "\n"
+
+def csv_lines(rows, serializer):
+    writer = csv.writer(echo_buffer())
+    yield writer.writerow([text_cell(name) for name in columns(serializer)])
+    for data in rows:
+        yield writer.writerow(flat_row(serializer, data))
+
+def xlsx_chunks(rows, serializer):
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append([text_cell(name) for name in columns(serializer)])
+    for data in rows:
+        sheet.append(flat_row(serializer, data))
+
+    with tempfile.TemporaryFile() as file:
+        workbook.save(file)
+        file.seek(0)
+        while chunk := file.read(FILE_CHUNK_SIZE):
+            yield chunk
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+def streaming_export(queryset, serializer_class, file_format, filename):
+    """
+    a StreamingHttpResponse with the queryset serialized by serializer_class in file_format,
+    one of EXPORT_FORMATS
+
+    Usage::
+
+        return streaming_export(self.get_queryset(), LanguagesSerializer, "csv", "languages")
+    """
+    rows = serialized_rows(queryset, serializer_class)
+    serializer = serializer_class()
+    if file_format == "jsonl":
+        content = jsonl_lines(rows)
+    elif file_format == "csv":
+        content = csv_lines(rows, serializer)
+    else:
+        content = xlsx_chunks(rows, serializer)
+
+    response = StreamingHttpResponse(content, content_type=EXPORT_FORMATS[file_format])
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{file_format}"'
+    return response
@@ -12,8 +12,8 @@ from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework import filters
 from django_filters.rest_framework import DjangoFilterBackend
-from core.logger import logger
 from django.db import transaction
+from ailla.solr import delete_on_commit
 
 from .models import Folders, Genre, Items, Persons, Organizations, Countries, Languages, Text, File, Collections
 from .serializers import TextSerializer
@@ -66,45 +66,8 @@ class FoldersViewSet(viewsets.ModelViewSet):
         else:
             if not has_edit_permission(user, instance):
                 return Response({"detail": "User does not have required permissions to delete this folder."}, status=status.HTTP_403_FORBIDDEN)
-        folder_id = instance.id
-        with transaction.atomic(): 
-            folder = Folders.objects.get(id=folder_id)
-
-            # Delete all text objects referenced in folder
-            ## Foreign-key text object fields are: name, description
-            folder_title_id = folder.title.id
-            folder_description_id = folder.description.id
-            
-            # Delete items and files
-            items = Items.objects.filter(parent_folder=folder_id)
-            if items:
-                for item in items:
-                    item_id = item.id
-                    item_name_id = item.name.id
-                    logger.debug(f"ITEM NAME TEXT OBJECT ID{item_name_id}")
-                    item_name_text = Text.objects.get(id=item_name_id)
-                    item_name_text.delete()
-                    
-                    item_description_id = item.description.id
-                    item_description_text = Text.objects.get(id=item_description_id)
-                    item_description_text.delete()
-
-                    # Delete item
-                    item.delete()
-
-            # Delete folder
-            folder.delete()
-
-            # Delete folder title text object
-            folder_title_text = Text.objects.get(id=folder_title_id)
-            folder_title_text.delete()
-
-            # Delete folder description text object
-            folder_description_text = Text.objects.get(id=folder_description_id)
-            folder_description_text.delete()
-
-
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        delete_folder(instance.id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
     
     @action(detail=True, methods=['GET'])
     def user_role(self, request, pk=None):
@@ -159,3 +122,31 @@ class FoldersViewSet(viewsets.ModelViewSet):
             ).get(pk=pk)
         items = folder.items.all()
         return Response(SimpleItemsSerializer(items, many=True).data, status=status.HTTP_200_OK)
+
+def delete_folder(folder_id):
+    """Deletes a folder with its items, their files and roles, and the Text rows they use.
+
+    The ids are read with one query per model and everything is deleted set by set, a hundred
+    rows per DELETE, instead of a few queries per item. Solr gets a single delete-by-id request
+    for the folder, its items and their files once the transaction has committed.
+    """
+    with transaction.atomic():
+        folder = Folders.objects.values('title_id', 'description_id').get(id=folder_id)
+        items = list(Items.objects.filter(parent_folder=folder_id).values_list('id', 'name_id', 'description_id'))
+        file_ids = list(File.objects.filter(parent_item__parent_folder=folder_id).values_list('id', flat=True))
+
+        text_ids = {folder['title_id'], folder['description_id']}
+        for _, name_id, description_id in items:
+            text_ids.update((name_id, description_id))
+        text_ids.discard(None)
+
+        # queryset deletes don't call Model.delete(), which queues these one object at a time
+        solr_ids = [f"{folder_id}:Folders"]
+        solr_ids += [f"{item_id}:Items" for item_id, _, _ in items]
+        solr_ids += [f"{file_id}:File" for file_id in file_ids]
+        delete_on_commit(solr_ids)
+
+        # the folder cascades to its items, their files, roles, genres and the user roles,
+        # then the Text rows go once nothing points to them anymore
+        Folders.objects.filter(id=folder_id).delete()
+        Text.objects.filter(id__in=text_ids).delete()
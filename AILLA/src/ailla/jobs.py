@@ -0,0 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections, transaction
+
+from core.logger import logger
+from .models import CollectionJobs
+
+"""
+Runs long publish/unpublish work off the request thread.
+
+Progress is kept on a CollectionJobs row rather than in memory, so any worker can answer
+a progress request. Jobs run on a small thread pool inside the worker that accepted them.
+"""
+executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="collection-jobs")
+
+def run_in_background(job:CollectionJobs, task):
+    """runs task(job) on the background pool once the current transaction commits"""
+    transaction.on_commit(lambda: executor.submit(run_job, job.id, task))
+
+def run_job(job_id, task):
+    """runs the task, keeping the job's status up to date"""
+    job = CollectionJobs.objects.get(id=job_id)
+    job.status = CollectionJobs.JobStatus.RUNNING
+    job.save(update_fields=["status", "last_updated"])
+
+    try:
+        task(job)
+        job.status = CollectionJobs.JobStatus.FAILED if job.failures else CollectionJobs.JobStatus.DONE
+    except Exception as e:
+        logger.error(f"Collection job {job.id} failed: {e}")
+        job.errors.append(str(e))
+        job.status = CollectionJobs.JobStatus.FAILED
+    finally:
+        job.save(update_fields=["status", "processed", "failures", "errors", "last_updated"])
+        # this thread's DB connection isn't closed by the request cycle
+        connections.close_all()
+
+def record_progress(job:CollectionJobs, processed, error=None):
+    """add a finished (or failed, if error is given) chunk of work to the job's counts"""
+    if error is None:
+        job.processed += processed
+    else:
+        job.failures += processed
+        job.errors.append(str(error))
+    job.save(update_fields=["processed", "failures", "errors", "last_updated"])
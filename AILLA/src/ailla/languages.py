@@ -3,15 +3,20 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from .models import Languages, Collections
 from .serializers import LanguagesSerializer, TextSerializer
-from django.db.models import Q
+from .serializers_collections import SimpleCollectionsSerializer
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
-from .pagination_utils import SmallResultsSetPagination
+from .pagination_utils import SmallResultsSetPagination, CachedIdsMixin, sorted_by_text
+from .text_search import search_filter
+from .exports import EXPORT_FORMATS, streaming_export
+from .authority_snapshots import languages_snapshot
+from .autosuggest import languages_autosuggest
 from django.db.models.functions import Coalesce, Lower
-from django.core.cache import cache
 
 import json
 
-class LanguagesViewSet(viewsets.ModelViewSet):
+class LanguagesViewSet(CachedIdsMixin, viewsets.ModelViewSet):
+    cache_prefix = 'languages'
+    keyset_field = 'sorted_name'
     queryset = Languages.objects.all()
     serializer_class = LanguagesSerializer
     pagination_class = SmallResultsSetPagination
@@ -21,40 +26,28 @@ class LanguagesViewSet(viewsets.ModelViewSet):
         # Get the 'lang' parameter from the query string, default to 'en' if not provided
         page_language = self.request.query_params.get('page_language', 'en')
         query = self.request.query_params.get('query', '')
-        cache_key = f'languages_queryset_{page_language}_{query}'
-        queryset = cache.get(cache_key)
-
-        if queryset is None:
-            # Define a mapping between page_language codes and model fields
-            page_language_field_mapping = {
-                'en': 'name__en_neutral',
-                'es': 'name__es_neutral',
-                'pt': 'name__pt_neutral',
-            }
-            
-            # Get the appropriate field name for sorting based on the passed page_language
-            order_field = page_language_field_mapping.get(page_language, 'name__en_neutral')
-            
-            # Fallback to English if the specified page_language name is empty
-            queryset = Languages.objects.annotate(
-                sorted_name=Coalesce(order_field, 'name__en_neutral')
-            ).select_related(
-                'name', 'description', 'language_family'
-            ).prefetch_related(
-                'countries'
-            ).filter(
-                Q(id__icontains=query) | 
-                Q(name__en__icontains=query) | 
-                Q(name__es__icontains=query) | 
-                Q(name__pt__icontains=query) |
-                Q(name__en_neutral__icontains=query) | 
-                Q(name__es_neutral__icontains=query) | 
-                Q(name__pt_neutral__icontains=query) |
-                Q(language_code__icontains=query)
-            ).order_by(Lower('sorted_name'))
-
-            cache.set(cache_key, queryset, timeout=300)
+
+        # Define a mapping between page_language codes and model fields
+        page_language_field_mapping = {
+            'en': 'name__en_neutral',
+            'es': 'name__es_neutral',
+            'pt': 'name__pt_neutral',
+        }
+        
+        # Get the appropriate field name for sorting based on the passed page_language
+        order_field = page_language_field_mapping.get(page_language, 'name__en_neutral')
         
+        # Fallback to English if the specified page_language name is empty
+        queryset = Languages.objects.annotate(
+            sorted_name=Coalesce(order_field, 'name__en_neutral')
+        ).select_related(
+            'name', 'description', 'language_family'
+        ).prefetch_related(
+            'countries'
+        ).filter(
+            search_filter(query, "name", "language_code")
+        ).order_by(Lower('sorted_name'))
+
         return queryset
 
 
@@ -90,44 +83,37 @@ class LanguagesViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def all(self, request):
-        cache_key = 'languages_all'
-        languages_data = cache.get(cache_key)
-
-        if languages_data is None:
-            languages = Languages.objects.all().select_related('name')
-
-            class LanguagesAllSerializer(serializers.ModelSerializer):
-                name = TextSerializer(required=False)
-                class Meta:
-                    model = Languages
-                    fields = ('id', 'name', 'language_code')
-
-            serializer = LanguagesAllSerializer(languages, many=True)
-            languages_data = serializer.data
-
-            cache.set(cache_key, languages_data, timeout=300)
-
-        return Response(languages_data, status=status.HTTP_200_OK)
+        return Response(languages_snapshot.serialize_all(('id', 'name', 'language_code')), status=status.HTTP_200_OK)
     
     @action(detail=False, methods=['get'])
     def download(self, request):
         queryset = self.get_queryset()  # Get the unpaginated queryset
+        file_format = request.query_params.get('file_format')
+
+        # csv, jsonl and xlsx are streamed in chunks, without file_format the whole list is returned as JSON
+        if file_format is not None:
+            if file_format not in EXPORT_FORMATS:
+                return Response({'error': 'Invalid file_format parameter'}, status=status.HTTP_400_BAD_REQUEST)
+            return streaming_export(queryset, LanguagesSerializer, file_format, 'languages')
+
         serializer = LanguagesSerializer(queryset, many=True)  # Serialize the data
         return Response(serializer.data)  # Return the serialized data
     
     @action(detail=True, methods=['get'])
     def collections(self, request, pk=None):
-        try:
-            language = Languages.objects.get(pk=pk)
-            collections = Collections.objects.filter(
-                Q(collection_languages=language),
-                draft=False
-            ).select_related('title', 'description')
-            
-            return Response(SimpleCollectionsSerializer(collections, many=True).data, status=status.HTTP_200_OK)
-        except Languages.DoesNotExist:
+        """a page of the published collections of the language, sorted by title"""
+        if not Languages.objects.filter(pk=pk).exists():
             return Response({'message': 'Language not found'}, status=status.HTTP_404_NOT_FOUND)
 
+        collections = Collections.objects.filter(
+            collection_languages=pk,
+            draft=False
+        ).select_related('title', 'description')
+
+        page_language = request.query_params.get('page_language', 'en')
+        page = self.paginate_queryset(sorted_by_text(collections, 'title', page_language))
+        return self.get_paginated_response(SimpleCollectionsSerializer(page, many=True).data)
+
     @action(detail=False, methods=['get'])
     def test(self, request):
         languages = Languages.objects.all()[:5]
@@ -152,24 +138,5 @@ class LanguagesViewSet(viewsets.ModelViewSet):
         except ValueError:
             return Response({'error': 'Invalid limit parameter'}, status=status.HTTP_400_BAD_REQUEST)
 
-        languages = Languages.objects.select_related('name').filter(
-            Q(id__icontains=query) | 
-            Q(name__en__icontains=query) | 
-            Q(name__es__icontains=query) | 
-            Q(name__pt__icontains=query) |
-            Q(name__en_neutral__icontains=query) | 
-            Q(name__es_neutral__icontains=query) | 
-            Q(name__pt_neutral__icontains=query) |
-            Q(language_code__icontains=query)
-        )[:limit]
-
-        class LanguagesAutosuggestSerializer(serializers.ModelSerializer):
-            name = TextSerializer()
-
-            class Meta:
-                model = Languages
-                fields = ('id', 'name', 'language_code')
-
-        serializer = LanguagesAutosuggestSerializer(languages, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(languages_autosuggest.search(query, limit), status=status.HTTP_200_OK)
     
@@ -0,0 +1,19 @@
+from ailla.collection_cards import rebuild_cards
+from ailla.models import Collections
+from core.logger import logger
+from django.core.management.base import BaseCommand
+
+class Command(BaseCommand):
+    """
+    Management command that rebuilds the list card of every collection
+
+    Cards are kept up to date on write and missing ones are built when a page needs them,
+    so this is only needed after changing what a card holds, or to fill the table in one go.
+    """
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500, help="number of collections rebuilt per query")
+
+    def handle(self, *args, **options):
+        collection_ids = Collections.objects.order_by("pk").values_list("pk", flat=True)
+        cards = rebuild_cards(collection_ids, chunk_size=options["chunk_size"])
+        logger.info(f"rebuilt {len(cards)} collection cards")
@@ -0,0 +1,219 @@
+import gc
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from ailla.collections import CollectionsViewSet
+from ailla.models import *
+from ailla.serializers_collections import CollectionsSerializer, CollectionsSolrSerializer
+from ailla.serializers_folders import FoldersSolrSerializer
+from ailla.solr import solr
+from ailla.solr_documents import collection_document, folder_document, collection_documents_queryset, folder_documents_queryset, bulk_documents
+from ailla.synthetic_data import SCALES, generate
+from core.logger import logger
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+# model, nested serializer, flat builder, queryset loading what both need
+BENCHMARKED = [
+    (Collections, CollectionsSolrSerializer, collection_document, collection_documents_queryset),
+    (Folders, FoldersSolrSerializer, folder_document, folder_documents_queryset),
+]
+
+class query_counter:
+    """counts the queries run on a connection, installed with connection.execute_wrapper"""
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class fake_solr_backend:
+    """
+    stands in for the solr server: pysolr still encodes every request,
+    but nothing leaves the process. Updates succeed, searches find nothing
+    """
+    def __init__(self):
+        self.requests = 0
+        self.bytes_sent = 0
+
+    def __call__(self, method, path="", body=None, headers=None, files=None):
+        self.requests += 1
+        if body:
+            self.bytes_sent += len(body)
+
+        if path.startswith("select"):
+            return json.dumps({"responseHeader": {"status": 0}, "response": {"numFound": 0, "start": 0, "docs": []}, "nextCursorMark": "*"})
+        return json.dumps({"responseHeader": {"status": 0, "QTime": 0}})
+
+@contextmanager
+def offline_solr():
+    """routes every request of the shared pysolr instance to a fake_solr_backend"""
+    backend = fake_solr_backend()
+    solr._send_request = backend
+    try:
+        yield backend
+    finally:
+        del solr._send_request
+
+def measure(run, rounds):
+    """
+    runs run() rounds times for the best time, then once more counting queries and peak memory
+
+    Returns:
+        tuple: (seconds, queries, peak bytes)
+    """
+    best = None
+    for _ in range(rounds):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    # tracemalloc slows everything down, so it gets a run of its own
+    counter = query_counter()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        with connection.execute_wrapper(counter):
+            run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, counter.count, peak
+
+def report(name, documents, seconds, queries, peak):
+    logger.info(
+        f"  {name:<45} {seconds / documents * 1e6:>9.0f}us/doc {queries:>8} queries {peak / 2**20:>8.1f}MiB peak"
+    )
+
+def api_queryset():
+    """the queryset the collections list endpoint serializes"""
+    # get_queryset only reads query_params from the request
+    view = CollectionsViewSet()
+    view.request = SimpleNamespace(query_params={})
+    return view.get_queryset()
+
+def api_serializer_skipped(queryset):
+    """why CollectionsSerializer can't run here, None when it can"""
+    # some of its method fields live in code that isn't part of this repo
+    try:
+        CollectionsSerializer(queryset[:1], many=True).data
+    except AttributeError as e:
+        return f"CollectionsSerializer fails in this tree ({e})"
+    return None
+
+
+class Command(BaseCommand):
+    """
+    Management command benchmarking solr document building and indexing
+
+    For Collections and Folders it compares the nested solr serializers, the flat document builders
+    and bulk_documents over the same rows, DB queries included, and reports time per document,
+    number of queries and peak Python memory for each. The collections API serializer is measured the
+    same way when it can run, and reported as skipped otherwise. Fails if the three don't build the
+    same documents for the same rows.
+
+    It then times a full solr_index run. Solr is always replaced by an in-process fake,
+    so the benchmark runs offline and never touches a real index.
+
+    --scale 1k|10k|100k first generates a deterministic synthetic archive with that many folders
+    (see ailla/synthetic_data.py) and rolls it back when done, so it can run against any database.
+    """
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=1000, help="number of objects of each model to serialize")
+        parser.add_argument("--rounds", type=int, default=3, help="times each case runs, the best time is reported")
+        parser.add_argument("--scale", choices=SCALES, help="benchmark a generated archive of this size instead of the existing data")
+        parser.add_argument("--seed", type=int, default=1, help="seed of the synthetic data generator")
+        parser.add_argument("--skip-index", action="store_true", help="don't time a full solr_index run")
+
+    def handle(self, *args, **options):
+        with offline_solr() as backend:
+            if options["scale"] is None:
+                self.benchmark(backend, options)
+                return
+
+            with transaction.atomic():
+                start = time.perf_counter()
+                counts = generate(options["scale"], seed=options["seed"])
+                logger.info(f"generated {counts} in {time.perf_counter() - start:.1f}s")
+
+                try:
+                    self.benchmark(backend, options)
+                finally:
+                    # the synthetic archive is never kept
+                    transaction.set_rollback(True)
+
+    def benchmark(self, backend:fake_solr_backend, options):
+        limit = options["limit"]
+        rounds = options["rounds"]
+
+        for model, serializer_class, build_document, documents_queryset in BENCHMARKED:
+            pks = list(model.objects.order_by("pk").values_list("pk", flat=True)[:limit])
+            if not pks:
+                logger.info(f"{model.__name__}: nothing to benchmark")
+                continue
+
+            objects = list(documents_queryset().filter(pk__in=pks).order_by("pk"))
+            bulk_docs = list(bulk_documents(model).build(pks))
+            # zip() would stop at the shorter list, a builder dropping or adding documents must fail
+            if len(objects) != len(pks) or len(bulk_docs) != len(pks):
+                raise CommandError(f"{model.__name__}: {len(pks)} rows but {len(objects)} serialized and {len(bulk_docs)} bulk documents")
+            expected_ids = {obj.get_solr_id() for obj in objects}
+            if {doc["id"] for doc in bulk_docs} != expected_ids:
+                raise CommandError(f"{model.__name__}: bulk_documents ids differ from the rows'")
+            if {build_document(obj)["id"] for obj in objects} != expected_ids:
+                raise CommandError(f"{model.__name__}: {build_document.__name__} ids differ from the rows'")
+
+            for obj, bulk_doc in zip(objects, bulk_docs):
+                if serializer_class(obj).data != build_document(obj):
+                    raise CommandError(f"{obj.get_solr_id()}: document builder output differs from {serializer_class.__name__}")
+                if serializer_class(obj).data != bulk_doc:
+                    raise CommandError(f"{obj.get_solr_id()}: bulk_documents output differs from {serializer_class.__name__}")
+
+            cases = [
+                (f"{serializer_class.__name__}, plain queryset", lambda: [serializer_class(obj).data for obj in model.objects.filter(pk__in=pks)]),
+                (f"{serializer_class.__name__}, prefetched", lambda: [serializer_class(obj).data for obj in documents_queryset().filter(pk__in=pks)]),
+                (f"{build_document.__name__}", lambda: [build_document(obj) for obj in documents_queryset().filter(pk__in=pks)]),
+                ("bulk_documents", lambda: bulk_documents(model).build(pks)),
+            ]
+            if model is Collections:
+                list_queryset = api_queryset().filter(pk__in=pks)
+                skipped = api_serializer_skipped(list_queryset)
+                if skipped is None:
+                    cases.append(("CollectionsSerializer, list endpoint queryset", lambda: CollectionsSerializer(list_queryset, many=True).data))
+
+            logger.info(f"{model.__name__} ({len(pks)} documents):")
+            for name, run in cases:
+                report(name, len(pks), *measure(run, rounds))
+            if model is Collections and skipped is not None:
+                logger.info(f"  CollectionsSerializer, list endpoint queryset: skipped, {skipped}")
+
+        if options["skip_index"]:
+            return
+
+        documents = sum(model.objects.filter(draft=False).count() for model, *_ in BENCHMARKED)
+        if not documents:
+            logger.info("solr_index: nothing to index")
+            return
+
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            checkpoint = os.path.join(checkpoint_dir, "checkpoint.json")
+            requests_before, bytes_before = backend.requests, backend.bytes_sent
+            seconds, queries, peak = measure(lambda: call_command("solr_index", checkpoint=checkpoint), 1)
+
+        logger.info(f"solr_index ({documents} documents, {documents / seconds:.0f} docs/sec):")
+        report("full reindex", documents, seconds, queries, peak)
+        # measure runs it twice, once for the time and once for the counts
+        logger.info(
+            f"  {(backend.requests - requests_before) // 2} solr requests, "
+            f"{(backend.bytes_sent - bytes_before) / 2 / 2**20:.1f}MiB sent per run"
+        )
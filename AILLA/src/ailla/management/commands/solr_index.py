@@ -1,56 +1,302 @@
+import json
+import os
+import tempfile
+import time
+
 from ailla.models import *
-from ailla.serializers_collections import CollectionsSolrSerializer
-from ailla.serializers_folders import FoldersSolrSerializer
+from ailla.solr_documents import bulk_documents
 from core.logger import logger
-from django.core.management.base import BaseCommand
-from ailla.solr import solr
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from ailla.solr import solr, fetch_content_hashes, CONTENT_HASH_FIELD
+
+# models that get indexed, in order
+INDEXED_MODELS = [Collections, Folders]
+
+def pk_chunks(queryset, chunk_size):
+    """yields lists of up to chunk_size pks of the queryset"""
+    chunk = []
+    for pk in queryset.values_list("pk", flat=True).iterator(chunk_size=chunk_size):
+        chunk.append(pk)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+class index_checkpoint:
+    """
+    remembers the last pk sent to solr for each model, saved to a json file
+    so an interrupted reindex can be resumed
+    """
+    def __init__(self, path):
+        self.path = path
+        self.last_pks = {}
+
+        if os.path.exists(self.path):
+            with open(self.path) as checkpoint_file:
+                self.last_pks = json.load(checkpoint_file)
+
+    def get(self, model_name):
+        """last pk indexed for the model, 0 if none"""
+        return self.last_pks.get(model_name, 0)
+
+    def update(self, last_pks:dict):
+        """record the last pk sent for each model and write the file"""
+        self.last_pks.update(last_pks)
+
+        # write to a temp file first so a crash mid-write can't corrupt the checkpoint
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as checkpoint_file:
+            json.dump(self.last_pks, checkpoint_file)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        """forget all progress"""
+        self.last_pks = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
 
 class solr_query_handler:
     """
-    stores solr data + submits it in batches
+    stores solr data + submits it in batches, keeping track of throughput
     """
-    def __init__(self):
+    # seconds between progress log lines
+    report_interval = 10
+
+    def __init__(self, batch_size=20, checkpoint:index_checkpoint=None, known_hashes:dict=None):
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint
+        # {solr id: content hash} of documents already in solr, unchanged documents aren't sent again
+        self.known_hashes = known_hashes
         self.counter = 0
+        self.skipped = 0
         self.json_data = []
-        
-    def add(self, data:json):
+        # last pk per model in json_data, saved to the checkpoint once the batch is posted
+        self.pending_pks = {}
+        # seconds spent loading rows, serializing them and posting them to solr
+        self.timings = {"db": 0.0, "serialize": 0.0, "post": 0.0}
+        self.started = time.monotonic()
+        self.last_report = self.started
+
+    def add(self, data:json, model_name=None, pk=None):
         """add a result to list, automatically sends to solr if limit is reached"""
+        if model_name is not None:
+            self.pending_pks[model_name] = pk
+
+        if self.known_hashes is not None and self.known_hashes.get(data.get("id")) == data.get(CONTENT_HASH_FIELD):
+            self.skipped += 1
+            return
+
         self.json_data.append(data)
         self.counter += 1
 
         # send data in batches
-        if len(self.json_data) > 20:
+        if len(self.json_data) > self.batch_size:
+            self.send()
+
+    def send(self):
+        """post the stored data to solr, then save the checkpoint"""
+        if self.json_data:
+            start = time.monotonic()
             solr.add(self.json_data)
+            self.timings["post"] += time.monotonic() - start
             # logger.debug(self.json_data)
-            self.json_data = []
-            
+        self.json_data = []
+
+        if self.checkpoint is not None and self.pending_pks:
+            self.checkpoint.update(self.pending_pks)
+        self.pending_pks = {}
+
+        if time.monotonic() - self.last_report >= self.report_interval:
+            self.report()
 
     def send_remaining(self):
         """submit any remaining data to solr and wipe list"""
-        solr.add(self.json_data)
+        self.send()
+        self.report()
+
+    def load(self, builder:bulk_documents, pks):
+        """read the rows the builder needs for the pks, timing it"""
+        start = time.monotonic()
+        loaded = builder.load(pks)
+        self.timings["db"] += time.monotonic() - start
+        return loaded
+
+    def serialize(self, builder:bulk_documents, loaded):
+        """build the solr documents from loaded rows, timing it"""
+        start = time.monotonic()
+        docs = builder.assemble(loaded)
+        self.timings["serialize"] += time.monotonic() - start
+        return docs
+
+    def timed(self, queryset):
+        """iterate over the queryset, counting the time spent waiting on the DB"""
+        iterator = iter(queryset)
+        while True:
+            start = time.monotonic()
+            try:
+                obj = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.timings["db"] += time.monotonic() - start
+            yield obj
+
+    def report(self):
+        """log docs/sec and where the time went"""
+        self.last_report = time.monotonic()
+        elapsed = self.last_report - self.started
+        rate = self.counter / elapsed if elapsed else 0
+        logger.info(
+            f"objects indexed: {self.counter} ({rate:.1f} docs/sec), unchanged: {self.skipped}, "
+            f"db: {self.timings['db']:.1f}s, serialize: {self.timings['serialize']:.1f}s, post: {self.timings['post']:.1f}s"
+        )
+
+
+def posted_fields(data):
+    """
+    the fields of a document as pysolr posts them: None and "" are skipped, in lists too,
+    and a list left empty sends no field
+    """
+    doc = {}
+    for key, value in data.items():
+        if isinstance(value, (list, tuple, set)):
+            value = [item for item in value if item is not None and item != ""]
+            if value:
+                doc[key] = value
+        elif value is not None and value != "":
+            doc[key] = value
+    return doc
+
+class jsonl_export_handler(solr_query_handler):
+    """
+    writes the solr documents to a JSON Lines file instead of posting them,
+    so they can be loaded into any number of solr environments with --load
+    """
+    def __init__(self, export_file, batch_size=20):
+        super().__init__(batch_size=batch_size)
+        self.export_file = export_file
+
+    def send(self):
+        """write the stored documents, one per line, with the fields pysolr would post"""
+        start = time.monotonic()
+        for data in self.json_data:
+            doc = posted_fields(data)
+            self.export_file.write(json.dumps(doc, cls=DjangoJSONEncoder, ensure_ascii=False))
+            self.export_file.write("\n")
+        self.timings["post"] += time.monotonic() - start
         self.json_data = []
 
+        if time.monotonic() - self.last_report >= self.report_interval:
+            self.report()
+
+
+def load_jsonl(path, chunk_size=5000):
+    """
+    streams a file written by --export into solr's JSON update handler.
+    lines are sent as they are, without being parsed, chunk_size documents per request,
+    with a single commit at the end
+    """
+    counter = 0
+    started = time.monotonic()
+    chunk = []
+
+    def post(chunk):
+        # the lines are already solr json, so skip pysolr's per-document encoding
+        solr._update(f"[{','.join(chunk)}]", commit=False, solrapi="JSON", clean_ctrl_chars=False)
+
+    with open(path, encoding="utf-8") as jsonl_file:
+        for line in jsonl_file:
+            line = line.strip()
+            if not line:
+                continue
+            chunk.append(line)
+
+            if len(chunk) >= chunk_size:
+                post(chunk)
+                counter += len(chunk)
+                chunk = []
+                logger.info(f"objects loaded: {counter} ({counter / (time.monotonic() - started):.1f} docs/sec)")
+
+    if chunk:
+        post(chunk)
+        counter += len(chunk)
+    solr.commit()
+    logger.info(f"objects loaded: {counter} in {time.monotonic() - started:.1f}s")
+
 
 class Command(BaseCommand):
     """
     Management command to trigger solr reindexing
-    
-    Note: comment out first line if you only want to overwrite, and not delete
+
+    A full run wipes solr first. Progress is saved to a checkpoint file after every batch,
+    run with --resume to continue an interrupted reindex without wiping.
+
+    --export path.jsonl writes the serialized documents to a file instead of sending them,
+    and --load path.jsonl sends such a file to solr without touching the database. Neither wipes solr.
+
+    --changed-only doesn't wipe solr either, it reads the content hash of every document in solr
+    and only sends the documents whose hash is different.
     """
+    def add_arguments(self, parser):
+        parser.add_argument("--resume", action="store_true", help="continue from the last checkpoint instead of wiping solr")
+        parser.add_argument("--batch-size", type=int, default=20, help="number of documents sent to solr per request")
+        parser.add_argument("--checkpoint", default=os.path.join(tempfile.gettempdir(), "solr_index_checkpoint.json"), help="path of the checkpoint file, in the temp directory by default")
+        parser.add_argument("--changed-only", action="store_true", help="don't wipe solr, only send documents that differ from what solr holds")
+        parser.add_argument("--export", metavar="PATH", help="write the solr documents to a JSON Lines file instead of sending them to solr")
+        parser.add_argument("--load", metavar="PATH", help="send a JSON Lines file written by --export to solr")
+        parser.add_argument("--chunk-size", type=int, default=5000, help="number of documents sent to solr per request with --load")
+
     def handle(self, *args, **options):
-        solr.delete(q='*:*') # wipes solr
+        if options["export"] and options["load"]:
+            raise CommandError("--export and --load can't be used together")
+
+        if options["load"]:
+            load_jsonl(options["load"], chunk_size=options["chunk_size"])
+            return
+
+        if options["export"]:
+            with open(options["export"], "w", encoding="utf-8") as export_file:
+                solr_handler = jsonl_export_handler(export_file, batch_size=options["batch_size"])
+                self.index(solr_handler)
+            return
+
+        checkpoint = index_checkpoint(options["checkpoint"])
+
+        known_hashes = None
+        if options["changed_only"]:
+            known_hashes = fetch_content_hashes()
+            logger.info(f"documents in solr: {len(known_hashes)}")
+
+        if options["resume"]:
+            logger.info(f"resuming reindex from {checkpoint.last_pks}")
+        else:
+            checkpoint.clear()
+            if not options["changed_only"]:
+                solr.delete(q='*:*') # wipes solr
+
+        solr_handler = solr_query_handler(batch_size=options["batch_size"], checkpoint=checkpoint, known_hashes=known_hashes)
+        self.index(solr_handler)
+
+        # finished, the next run starts from scratch
+        checkpoint.clear()
+
+    def index(self, solr_handler:solr_query_handler):
+        """serialize every published object and hand it to solr_handler"""
+        checkpoint = solr_handler.checkpoint
 
-        solr_handler = solr_query_handler()
-        
-        # Index Collections
-        for collection in Collections.objects.filter(draft=False):
-            collection:Collections
-            solr_handler.add(CollectionsSolrSerializer(collection).data)
+        # Index Collections, then Folders, in pk order so the checkpoint is meaningful
+        for model in INDEXED_MODELS:
+            model_name = model.__name__
+            last_pk = checkpoint.get(model_name) if checkpoint is not None else 0
+            queryset = model.objects.filter(draft=False, pk__gt=last_pk).order_by("pk")
 
-        # Index Folders
-        for folder in Folders.objects.filter(draft=False):
-            folder:Folders
-            solr_handler.add(FoldersSolrSerializer(folder).data)
+            # documents are built from plain rows, a chunk of pks at a time
+            builder = bulk_documents(model)
+            for pks in solr_handler.timed(pk_chunks(queryset, 500)):
+                for data in solr_handler.serialize(builder, solr_handler.load(builder, pks)):
+                    solr_handler.add(data, model_name, data["pk"])
 
         solr_handler.send_remaining()
-        logger.info(f"objects indexed: {solr_handler.counter}")
\ No newline at end of file
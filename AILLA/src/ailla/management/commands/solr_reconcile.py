@@ -0,0 +1,122 @@
+from ailla.management.commands.solr_index import INDEXED_MODELS
+from ailla.solr import solr, CONTENT_HASH_FIELD
+from ailla.solr_documents import bulk_documents
+from core.logger import logger
+from django.core.management.base import BaseCommand
+
+def solr_rows(model_name, rows=2000):
+    """yields (pk, content hash, solr id) for every solr document of a model, in pk order, read with a cursor"""
+    cursor = "*"
+    while True:
+        results = solr.search(
+            "*:*",
+            fq=f"model:{model_name}",
+            fl=f"id,pk,{CONTENT_HASH_FIELD}",
+            sort="pk asc,id asc",
+            rows=rows,
+            cursorMark=cursor,
+        )
+        for doc in results.docs:
+            yield int(doc["pk"]), doc.get(CONTENT_HASH_FIELD), doc["id"]
+
+        if not results.nextCursorMark or results.nextCursorMark == cursor:
+            break
+        cursor = results.nextCursorMark
+
+def db_rows(model, chunk_size=2000):
+    """yields the pk of every published row of a model, in pk order"""
+    return model.objects.filter(draft=False).order_by("pk").values_list("pk", flat=True).iterator(chunk_size=chunk_size)
+
+
+class solr_fixer:
+    """
+    collects the differences found for one model and fixes them in batches
+
+    Rows are rebuilt a batch at a time and compared by content hash, since last_updated isn't
+    changed by every edit. Documents missing from solr, or whose hash differs, are resent
+    """
+    def __init__(self, model, dry_run=False, batch_size=500):
+        self.model = model
+        self.builder = bulk_documents(model)
+        self.dry_run = dry_run
+        self.batch_size = batch_size
+        self.counts = {"added": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+        # {pk: hash stored in solr, None when solr has no document}
+        self.to_check = {}
+        self.to_delete = []
+
+    def check(self, pk, solr_hash=None):
+        """rebuild the row with this pk and resend it unless solr_hash is already its hash"""
+        self.to_check[pk] = solr_hash
+        if len(self.to_check) >= self.batch_size:
+            self.send()
+
+    def delete(self, solr_id):
+        """remove a document that has no published row"""
+        self.counts["deleted"] += 1
+        self.to_delete.append(solr_id)
+        if len(self.to_delete) >= self.batch_size:
+            self.send()
+
+    def send(self):
+        """rebuild the queued rows and post the changed ones, delete the queued ids"""
+        docs = []
+        if self.to_check:
+            for doc in self.builder.build(list(self.to_check)):
+                solr_hash = self.to_check[doc["pk"]]
+                if solr_hash == doc[CONTENT_HASH_FIELD]:
+                    self.counts["unchanged"] += 1
+                else:
+                    self.counts["added" if solr_hash is None else "updated"] += 1
+                    docs.append(doc)
+
+        if not self.dry_run:
+            if docs:
+                solr.add(docs, commit=False)
+            if self.to_delete:
+                solr.delete(id=self.to_delete, commit=False)
+        self.to_check = {}
+        self.to_delete = []
+
+
+class Command(BaseCommand):
+    """
+    Management command that finds and fixes differences between the database and solr
+
+    Solr documents and published rows are both read in pk order and merge-joined, so memory use
+    doesn't grow with the size of the index. Rows missing from solr are added, rows whose rebuilt
+    document has a different content hash are resent, and documents without a published row are deleted.
+    """
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="only report the differences")
+        parser.add_argument("--batch-size", type=int, default=500, help="number of documents fixed per solr request")
+
+    def handle(self, *args, **options):
+        for model in INDEXED_MODELS:
+            fixer = solr_fixer(model, dry_run=options["dry_run"], batch_size=options["batch_size"])
+            self.reconcile(model, fixer)
+
+            fixer.send()
+            logger.info(f"{model.__name__}: {fixer.counts}")
+
+        if not options["dry_run"]:
+            solr.commit()
+
+    def reconcile(self, model, fixer:solr_fixer):
+        """merge-join the DB and solr streams of one model, queuing a fix for every difference"""
+        db_iterator = iter(db_rows(model))
+        solr_iterator = solr_rows(model.__name__)
+        db_row = next(db_iterator, None)
+        solr_row = next(solr_iterator, None)
+
+        while db_row is not None or solr_row is not None:
+            if solr_row is None or (db_row is not None and db_row < solr_row[0]):
+                fixer.check(db_row)
+                db_row = next(db_iterator, None)
+            elif db_row is None or solr_row[0] < db_row:
+                fixer.delete(solr_row[2])
+                solr_row = next(solr_iterator, None)
+            else:
+                fixer.check(db_row, solr_row[1])
+                db_row = next(db_iterator, None)
+                solr_row = next(solr_iterator, None)
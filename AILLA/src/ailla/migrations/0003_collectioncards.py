@@ -0,0 +1,22 @@
+# Generated by Django 4.1.10 on 2026-10-19 04:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ailla', '0002_collectionjobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionCards',
+            fields=[
+                ('collection', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='ailla.collections')),
+                ('data', models.JSONField(default=dict)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
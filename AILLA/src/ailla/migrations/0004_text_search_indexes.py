@@ -0,0 +1,83 @@
+from django.db import migrations
+
+# PostgreSQL: trigram indexes matching the UPPER(...) LIKE UPPER(...) that icontains generates
+POSTGRES_CREATE = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    *[
+        f'CREATE INDEX IF NOT EXISTS ailla_text_{column}_trgm ON ailla_text USING gin (UPPER("{column}"::text) gin_trgm_ops)'
+        for column in ("en_neutral", "es_neutral", "pt_neutral")
+    ],
+]
+POSTGRES_DROP = [
+    f"DROP INDEX IF EXISTS ailla_text_{column}_trgm"
+    for column in ("en_neutral", "es_neutral", "pt_neutral")
+]
+
+# SQLite: an FTS5 index over the Text table, kept in sync by triggers
+SQLITE_CREATE = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS ailla_text_search USING fts5(
+        en_neutral, es_neutral, pt_neutral, content='ailla_text', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS ailla_text_search_insert AFTER INSERT ON ailla_text BEGIN
+        INSERT INTO ailla_text_search(rowid, en_neutral, es_neutral, pt_neutral)
+        VALUES (new.id, new.en_neutral, new.es_neutral, new.pt_neutral);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS ailla_text_search_delete AFTER DELETE ON ailla_text BEGIN
+        INSERT INTO ailla_text_search(ailla_text_search, rowid, en_neutral, es_neutral, pt_neutral)
+        VALUES ('delete', old.id, old.en_neutral, old.es_neutral, old.pt_neutral);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS ailla_text_search_update AFTER UPDATE ON ailla_text BEGIN
+        INSERT INTO ailla_text_search(ailla_text_search, rowid, en_neutral, es_neutral, pt_neutral)
+        VALUES ('delete', old.id, old.en_neutral, old.es_neutral, old.pt_neutral);
+        INSERT INTO ailla_text_search(rowid, en_neutral, es_neutral, pt_neutral)
+        VALUES (new.id, new.en_neutral, new.es_neutral, new.pt_neutral);
+    END""",
+    # index the rows that already exist
+    "INSERT INTO ailla_text_search(ailla_text_search) VALUES ('rebuild')",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS ailla_text_search_insert",
+    "DROP TRIGGER IF EXISTS ailla_text_search_delete",
+    "DROP TRIGGER IF EXISTS ailla_text_search_update",
+    "DROP TABLE IF EXISTS ailla_text_search",
+]
+
+def sqlite_has_trigram_fts(cursor):
+    """FTS5 with the trigram tokenizer needs SQLite 3.34+ built with FTS5"""
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE temp.ailla_fts_check USING fts5(x, tokenize='trigram')")
+        cursor.execute("DROP TABLE temp.ailla_fts_check")
+        return True
+    except Exception:
+        return False
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == "postgresql":
+            statements = POSTGRES_CREATE
+        elif vendor == "sqlite" and sqlite_has_trigram_fts(cursor):
+            statements = SQLITE_CREATE
+        else:
+            # other databases keep searching without an index
+            return
+        for statement in statements:
+            cursor.execute(statement)
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {"postgresql": POSTGRES_DROP, "sqlite": SQLITE_DROP}.get(vendor, [])
+    with schema_editor.connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ailla", "0003_collectioncards"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.1.10 on 2026-10-19 05:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ailla', '0004_text_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contributorrole',
+            index=models.Index(fields=['organization', 'item'], name='ailla_role_org_item_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contributorrole',
+            index=models.Index(fields=['person', 'item'], name='ailla_role_person_item_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+from django.db import migrations
+
+# Text.save leaves *_neutral NULL for texts over 300 characters, text_search.long_texts
+# matches those on the original column. These indexes only cover such rows.
+COLUMNS = ("en", "es", "pt")
+
+# PostgreSQL: partial trigram indexes matching the UPPER(...) LIKE UPPER(...) that icontains generates
+POSTGRES_CREATE = [
+    f'CREATE INDEX IF NOT EXISTS ailla_text_{column}_long_trgm ON ailla_text USING gin (UPPER("{column}"::text) gin_trgm_ops) '
+    f'WHERE "{column}_neutral" IS NULL'
+    for column in COLUMNS
+]
+POSTGRES_DROP = [f"DROP INDEX IF EXISTS ailla_text_{column}_long_trgm" for column in COLUMNS]
+
+# SQLite: partial indexes finding the long rows without a scan of the table, the LIKE runs on those only
+SQLITE_CREATE = [
+    f'CREATE INDEX IF NOT EXISTS ailla_text_{column}_long ON ailla_text ("{column}_neutral") WHERE "{column}_neutral" IS NULL'
+    for column in COLUMNS
+]
+SQLITE_DROP = [f"DROP INDEX IF EXISTS ailla_text_{column}_long" for column in COLUMNS]
+
+def create_long_text_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {"postgresql": POSTGRES_CREATE, "sqlite": SQLITE_CREATE}.get(vendor, [])
+    with schema_editor.connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+def drop_long_text_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {"postgresql": POSTGRES_DROP, "sqlite": SQLITE_DROP}.get(vendor, [])
+    with schema_editor.connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ailla", "0005_contributorrole_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_long_text_indexes, drop_long_text_indexes),
+    ]
@@ -1,11 +1,12 @@
 import json
 import os
+import uuid
 from django.forms import ValidationError
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 from core.logger import logger
-from .solr import solr
+from .solr import delete_on_commit
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -144,9 +145,17 @@ class Collections(models.Model):
     def get_solr_id(self):
         """unique id used in solr add or delete requests"""
         return f"{self.pk}:Collections"
+
+    def get_cascade_solr_ids(self):
+        """solr ids of this collection and every folder, item and file deleted along with it"""
+        solr_ids = [self.get_solr_id()]
+        solr_ids += [f"{pk}:Folders" for pk in Folders.objects.filter(parent_collection=self).values_list("pk", flat=True)]
+        solr_ids += [f"{pk}:Items" for pk in Items.objects.filter(parent_folder__parent_collection=self).values_list("pk", flat=True)]
+        solr_ids += [f"{pk}:File" for pk in File.objects.filter(parent_item__parent_folder__parent_collection=self).values_list("pk", flat=True)]
+        return solr_ids
     
     def delete(self):
-        solr.delete(id=self.get_solr_id())
+        delete_on_commit(self.get_cascade_solr_ids())
         super(Collections, self).delete()
 
 # Folders are groups of items and files meant to organize the collection
@@ -176,8 +185,15 @@ class Folders(models.Model):
         """unique id used in solr add or delete requests"""
         return f"{self.pk}:Folders"
 
+    def get_cascade_solr_ids(self):
+        """solr ids of this folder and every item and file deleted along with it"""
+        solr_ids = [self.get_solr_id()]
+        solr_ids += [f"{pk}:Items" for pk in Items.objects.filter(parent_folder=self).values_list("pk", flat=True)]
+        solr_ids += [f"{pk}:File" for pk in File.objects.filter(parent_item__parent_folder=self).values_list("pk", flat=True)]
+        return solr_ids
+
     def delete(self):
-        solr.delete(id=self.get_solr_id())
+        delete_on_commit(self.get_cascade_solr_ids())
         super(Folders, self).delete()
 
 def get_current_date():
@@ -238,9 +254,15 @@ class Items(models.Model):
     def get_solr_id(self):
         """unique id used in solr add or delete requests"""
         return f"{self.pk}:Items"
+
+    def get_cascade_solr_ids(self):
+        """solr ids of this item and every file deleted along with it"""
+        solr_ids = [self.get_solr_id()]
+        solr_ids += [f"{pk}:File" for pk in File.objects.filter(parent_item=self).values_list("pk", flat=True)]
+        return solr_ids
     
     def delete(self):
-        solr.delete(id=self.get_solr_id())
+        delete_on_commit(self.get_cascade_solr_ids())
         super(Items, self).delete()
 
 class ContributorRole(models.Model):
@@ -249,6 +271,13 @@ class ContributorRole(models.Model):
     item = models.ForeignKey(Items, on_delete=models.CASCADE)
     role_name = models.ForeignKey(ParticipantRoles, on_delete=models.CASCADE)
 
+    class Meta:
+        # the items of a contributor are read from the index alone
+        indexes = [
+            models.Index(fields=["organization", "item"], name="ailla_role_org_item_idx"),
+            models.Index(fields=["person", "item"], name="ailla_role_person_item_idx"),
+        ]
+
     def clean(self):
         if not (self.person or self.organization):
             raise ValidationError("Role must have either a person or an organization")
@@ -298,9 +327,40 @@ class File(models.Model):
         return f"{self.pk}:File"
     
     def delete(self):
-        solr.delete(id=self.get_solr_id())
+        delete_on_commit([self.get_solr_id()])
         super(File, self).delete()
 
+# Publish/unpublish runs in the background, these rows report its progress
+class CollectionJobs(models.Model):
+    class JobTypes(models.TextChoices):
+        PUBLISH = "PUB", _("Publish")
+        UNPUBLISH = "UNP", _("Unpublish")
+
+    class JobStatus(models.TextChoices):
+        QUEUED = "QUEUED", _("Queued")
+        RUNNING = "RUNNING", _("Running")
+        DONE = "DONE", _("Done")
+        FAILED = "FAILED", _("Failed")
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    job_type = models.CharField(choices=JobTypes.choices, max_length=3)
+    collection = models.ForeignKey(Collections, on_delete=models.CASCADE, related_name="jobs")
+    status = models.CharField(choices=JobStatus.choices, default=JobStatus.QUEUED, max_length=7)
+    # number of objects (collection, folders, items, files) the job has to go through
+    total = models.IntegerField(default=0)
+    processed = models.IntegerField(default=0)
+    failures = models.IntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    last_updated = models.DateTimeField(auto_now=True)
+
+# Precomputed summary of a collection for list pages, kept up to date by collection_cards.py
+class CollectionCards(models.Model):
+    collection = models.OneToOneField(Collections, on_delete=models.CASCADE, primary_key=True, related_name="card")
+    data = models.JSONField(default=dict)
+    last_updated = models.DateTimeField(auto_now=True)
+
 class UserProfiles(models.Model):
     class UserRoles(models.TextChoices):
         SUPERADMIN = "SUPER", _("SuperAdmin")
@@ -1,17 +1,23 @@
-from rest_framework import viewsets, status, serializers
+from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .models import Organizations, Text, Languages, Collections, ContributorRole
-from .serializers import OrganizationsSerializer, TextSerializer
+from .models import Organizations, Text, Languages, Collections, ContributorRole, Items
+from .serializers import OrganizationsSerializer
+from .serializers_collections import SimpleCollectionsSerializer
 from django.db.models import Q
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
-from .pagination_utils import SmallResultsSetPagination
+from .pagination_utils import SmallResultsSetPagination, CachedIdsMixin, sorted_by_text
+from .text_search import search_filter
+from .exports import EXPORT_FORMATS, streaming_export
+from .authority_snapshots import organizations_snapshot
+from .autosuggest import organizations_autosuggest
 from django.db.models.functions import Coalesce, Lower
-from django.core.cache import cache
 
 import json
 
-class OrganizationsViewSet(viewsets.ModelViewSet):
+class OrganizationsViewSet(CachedIdsMixin, viewsets.ModelViewSet):
+    cache_prefix = 'organizations'
+    keyset_field = 'sorted_name'
     queryset = Organizations.objects.all()
     serializer_class = OrganizationsSerializer
     pagination_class = SmallResultsSetPagination
@@ -21,40 +27,29 @@ class OrganizationsViewSet(viewsets.ModelViewSet):
         # Get the 'lang' parameter from the query string, default to 'en' if not provided
         page_language = self.request.query_params.get('page_language', 'en')
         query = self.request.query_params.get('query', '')
-        cache_key = f'organizations_queryset_{page_language}_{query}'
-        queryset = cache.get(cache_key)
-                
-        if queryset is None:
-            # Define a mapping between page_language codes and model fields
-            page_language_field_mapping = {
-                'en': 'org_name__en_neutral',
-                'es': 'org_name__es_neutral',
-                'pt': 'org_name__pt_neutral',
-            }
-            
-            # Get the appropriate field name for sorting based on the passed page_language
-            order_field = page_language_field_mapping.get(page_language, 'org_name__en_neutral')
-            
-            # Fallback to English if the specified page_language name is empty
-            queryset = Organizations.objects.annotate(
-                sorted_name=Coalesce(order_field, 'org_name__en_neutral')
-            ).select_related(
-                'org_name', 'description'
-            ).prefetch_related(
-                'research_languages__name', 
-                'research_languages__description'
-            ).filter(
-                Q(id__icontains=query) | 
-                Q(org_name__en__icontains=query) | 
-                Q(org_name__es__icontains=query) | 
-                Q(org_name__pt__icontains=query) |
-                Q(org_name__en_neutral__icontains=query) |
-                Q(org_name__es_neutral__icontains=query) |
-                Q(org_name__pt_neutral__icontains=query)
-            ).order_by(Lower('sorted_name'))
-
-            cache.set(cache_key, queryset, timeout=300)
+
+        # Define a mapping between page_language codes and model fields
+        page_language_field_mapping = {
+            'en': 'org_name__en_neutral',
+            'es': 'org_name__es_neutral',
+            'pt': 'org_name__pt_neutral',
+        }
+        
+        # Get the appropriate field name for sorting based on the passed page_language
+        order_field = page_language_field_mapping.get(page_language, 'org_name__en_neutral')
         
+        # Fallback to English if the specified page_language name is empty
+        queryset = Organizations.objects.annotate(
+            sorted_name=Coalesce(order_field, 'org_name__en_neutral')
+        ).select_related(
+            'org_name', 'description'
+        ).prefetch_related(
+            'research_languages__name', 
+            'research_languages__description'
+        ).filter(
+            search_filter(query, "org_name")
+        ).order_by(Lower('sorted_name'))
+
         return queryset
 
     
@@ -90,54 +85,63 @@ class OrganizationsViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def all(self, request):
-        cache_key = 'organizations_all'
-        organizations_data = cache.get(cache_key)
-
-        if organizations_data is None:
-            organizations = Organizations.objects.all().select_related("org_name")
-
-            class OrganizationsAllSerializer(serializers.ModelSerializer):
-                org_name = TextSerializer(required=False)
-                class Meta:
-                    model = Organizations
-                    fields = ('id', 'org_name', 'acronym')
-
-            serializer = OrganizationsAllSerializer(organizations, many=True)
-            organizations_data = serializer.data
-
-            cache.set(cache_key, organizations_data, timeout=300)
-
-        return Response(organizations_data, status=status.HTTP_200_OK)
+        return Response(organizations_snapshot.serialize_all(('id', 'org_name', 'acronym')), status=status.HTTP_200_OK)
     
     @action(detail=False, methods=['get'])
     def download(self, request):
         queryset = self.get_queryset()  # Get the unpaginated queryset
+        file_format = request.query_params.get('file_format')
+
+        # csv, jsonl and xlsx are streamed in chunks, without file_format the whole list is returned as JSON
+        if file_format is not None:
+            if file_format not in EXPORT_FORMATS:
+                return Response({'error': 'Invalid file_format parameter'}, status=status.HTTP_400_BAD_REQUEST)
+            return streaming_export(queryset, OrganizationsSerializer, file_format, 'organizations')
+
         serializer = OrganizationsSerializer(queryset, many=True)  # Serialize the data
         return Response(serializer.data)  # Return the serialized data
     
     @action(detail=True, methods=['get'])
     def collections(self, request, pk=None):
-        try:
-            organization = Organizations.objects.get(pk=pk)
-            collections = Collections.objects.filter(
-                Q(collectors_orgs=organization) | Q(depositors_orgs=organization),
-                draft=False
-            ).select_related('title', 'description')
-            
-            return Response(SimpleCollectionsSerializer(collections, many=True).data, status=status.HTTP_200_OK)
-        except Organizations.DoesNotExist:
+        """a page of the published collections the organization collected or deposited, sorted by title"""
+        if not Organizations.objects.filter(pk=pk).exists():
             return Response({'message': 'Organization not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        # semi-joins on the two relations, so a collection listed in both comes once without a DISTINCT
+        collectors = Collections.collectors_orgs.through.objects.filter(organizations=pk).values('collections')
+        depositors = Collections.depositors_orgs.through.objects.filter(organizations=pk).values('collections')
+        collections = Collections.objects.filter(
+            Q(pk__in=collectors) | Q(pk__in=depositors),
+            draft=False
+        ).select_related('title', 'description')
+
+        page_language = request.query_params.get('page_language', 'en')
+        page = self.paginate_queryset(sorted_by_text(collections, 'title', page_language))
+        return self.get_paginated_response(SimpleCollectionsSerializer(page, many=True).data)
         
     @action(detail=True, methods=['get'])
     def items(self, request, pk=None):
-        try:
-            organization = Organizations.objects.get(pk=pk)
-            contributor_roles = ContributorRole.objects.filter(organization=organization).select_related('item','item__name','item__description')
-            items = [role.item for role in contributor_roles if role.item.draft is False]
-
-            return Response(SimpleItemsSerializer(items, many=True).data, status=status.HTTP_200_OK)
-        except Organizations.DoesNotExist:
+        """
+        a page of the published items the organization contributed to, sorted by name.
+        ?visibility=PUB,LOG keeps only items with one of those visibilities
+        """
+        if not Organizations.objects.filter(pk=pk).exists():
             return Response({'message': 'organization not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        # read from the (organization, item) index, an item with several roles comes once
+        roles = ContributorRole.objects.filter(organization=pk).values('item')
+        items = Items.objects.filter(pk__in=roles, draft=False).select_related('name', 'description')
+
+        visibility = request.query_params.get('visibility')
+        if visibility:
+            visibility = visibility.split(',')
+            if not set(visibility) <= set(Items.Visibility.values):
+                return Response({'error': 'Invalid visibility parameter'}, status=status.HTTP_400_BAD_REQUEST)
+            items = items.filter(visibility__in=visibility)
+
+        page_language = request.query_params.get('page_language', 'en')
+        page = self.paginate_queryset(sorted_by_text(items, 'name', page_language))
+        return self.get_paginated_response(SimpleItemsSerializer(page, many=True).data)
     
     @action(detail=False, methods=['get'])
     def autosuggest(self, request):
@@ -150,24 +154,6 @@ class OrganizationsViewSet(viewsets.ModelViewSet):
         except ValueError:
             return Response({'error': 'Invalid limit parameter'}, status=status.HTTP_400_BAD_REQUEST)
 
-        organizations = Organizations.objects.select_related('org_name').filter(
-            Q(id__icontains=query) | 
-            Q(org_name__en__icontains=query) | 
-            Q(org_name__es__icontains=query) | 
-            Q(org_name__pt__icontains=query) |
-            Q(org_name__en_neutral__icontains=query) |
-            Q(org_name__es_neutral__icontains=query) |
-            Q(org_name__pt_neutral__icontains=query)
-        )[:limit]
-
-        class OrganizationsAutosuggestSerializer(serializers.ModelSerializer):
-            org_name = TextSerializer()
-
-            class Meta:
-                model = Organizations
-                fields = ('id', 'org_name')
-
-        serializer = OrganizationsAutosuggestSerializer(organizations, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(organizations_autosuggest.search(query, limit), status=status.HTTP_200_OK)
 
     
\ No newline at end of file
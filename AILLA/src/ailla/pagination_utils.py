@@ -1,23 +1,328 @@
+import base64
+import hashlib
+import json
+import uuid
+
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, DatabaseError
+from django.db.models import Q, Value, QuerySet
+from django.db.models.functions import Coalesce, Lower
+from django.db.models.signals import post_save, post_delete
+from django.utils.functional import cached_property
 from math import ceil
 
+from .deferred import on_commit_batch
+from .models import Collections, Languages, Countries, Organizations, Items, ContributorRole
+
+# models whose list caches (id lists and counts) are keyed by a version that changes on every write
+LISTED_MODELS = [Collections, Languages, Countries, Organizations, Items]
+
+# unfiltered tables at least this big are counted from the planner's estimate
+ESTIMATE_MIN_ROWS = 100000
+
+def list_version(model):
+    """token replaced whenever a row of the model is saved or deleted, part of its list cache keys"""
+    return cache.get_or_set(f'list_version_{model._meta.label_lower}', lambda: uuid.uuid4().hex, timeout=None)
+
+# list version keys bumped during the current transaction
+version_bumps = on_commit_batch(lambda keys: cache.set_many({key: uuid.uuid4().hex for key in keys}, timeout=None), "list versions")
+
+def bump_list_version(sender, **kwargs):
+    """
+    post_save/post_delete receiver, orphans the model's cached id lists and counts once the write commits.
+    Every version bumped during a transaction is replaced once
+    """
+    version_bumps.add([f'list_version_{sender._meta.label_lower}'])
+
+for model in LISTED_MODELS:
+    post_save.connect(bump_list_version, sender=model, dispatch_uid=f'list_version_{model.__name__}')
+    post_delete.connect(bump_list_version, sender=model, dispatch_uid=f'list_version_{model.__name__}')
+
+def bump_items_version(sender, **kwargs):
+    """ContributorRole post_save/post_delete receiver, the contributor item lists are counts of Items"""
+    bump_list_version(Items)
+
+post_save.connect(bump_items_version, sender=ContributorRole, dispatch_uid='list_version_ContributorRole')
+post_delete.connect(bump_items_version, sender=ContributorRole, dispatch_uid='list_version_ContributorRole')
+
+def sorted_by_text(queryset, text_field, page_language='en'):
+    """
+    orders a queryset by one of its Text fields in the page language, falling back to English,
+    annotated as sorted_name like the authority lists so their keyset pagination applies
+    """
+    if page_language not in ('en', 'es', 'pt'):
+        page_language = 'en'
+    return queryset.annotate(
+        sorted_name=Coalesce(f'{text_field}__{page_language}_neutral', f'{text_field}__en_neutral')
+    ).order_by(Lower('sorted_name'), 'pk')
+
+def estimated_count(queryset):
+    """the planner's row estimate for an unfiltered queryset over a large table, None otherwise"""
+    query = queryset.query
+    if query.where or query.distinct or query.is_sliced:
+        return None
+
+    table = queryset.model._meta.db_table
+    connection = connections[queryset.db]
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            elif connection.vendor == 'sqlite':
+                # only there once ANALYZE ran, the first number of stat is the row count
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+            else:
+                return None
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+
+    if row is None or row[0] is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= ESTIMATE_MIN_ROWS else None
+
+def cached_count(queryset, timeout=300):
+    """
+    (count, exact) for a queryset: the planner estimate for unfiltered large tables,
+    otherwise an exact COUNT cached per filter signature (the SQL) and list version
+    """
+    estimate = estimated_count(queryset)
+    if estimate is not None:
+        return estimate, False
+
+    queryset = queryset.order_by()
+    try:
+        signature = hashlib.md5(str(queryset.query).encode()).hexdigest()
+    except EmptyResultSet:
+        return 0, True
+
+    cache_key = f'count_{queryset.model._meta.label_lower}_{list_version(queryset.model)}_{signature}'
+    count = cache.get(cache_key)
+    if count is None:
+        count = queryset.count()
+        cache.set(cache_key, count, timeout=timeout)
+    return count, True
+
+class CachedCountPaginator(Paginator):
+    """a Paginator counting querysets with cached_count, count_exact says whether it is exact"""
+    count_exact = True
+
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, QuerySet):
+            count, self.count_exact = cached_count(self.object_list)
+            return count
+        return super().count
+
 # Create your views here.
 class SmallResultsSetPagination(PageNumberPagination):
+    """
+    Page number pagination, or keyset pagination when the request has a ``cursor`` parameter
+    (empty for the first page). Keyset pages seek from the last row of the previous page
+    instead of skipping rows, so every page costs the same.
+
+    Querysets are ordered by the view's ``keyset_field`` annotation (lowercased, the way the
+    list querysets sort) and then by id. Cached id lists (see hydrated_ids) are sliced by position.
+    The ``next`` and ``previous`` links carry opaque cursors.
+
+    Counts come from CachedCountPaginator: cached per filter signature, or estimated for large
+    unfiltered tables, in which case ``count_exact`` is false.
+    """
+    django_paginator_class = CachedCountPaginator
     page_size = 15
     page_size_query_param = 'per_page'
     max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        direction, position, pk = self.decode_cursor(request.query_params[self.cursor_query_param])
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        self.count = paginator.count
+        self.count_exact = paginator.count_exact
+        if isinstance(queryset, hydrated_ids):
+            page, keys, has_more = self.seek_ids(queryset, direction, position, pk, page_size)
+        else:
+            keyset_field = getattr(view, 'keyset_field', None)
+            if keyset_field is None:
+                raise NotFound(self.invalid_cursor_message)
+            page, keys, has_more = self.seek_queryset(queryset, keyset_field, direction, position, pk, page_size)
+
+        # going back from a page always leaves a next page, going forward a previous one
+        has_next = has_more if direction != 'previous' else True
+        has_previous = has_more if direction == 'previous' else direction == 'next'
+        self.next_cursor = self.encode_cursor('next', *keys[-1]) if keys and has_next else None
+        self.previous_cursor = self.encode_cursor('previous', *keys[0]) if keys and has_previous else None
+        return page
+
+    def seek_ids(self, rows, direction, position, pk, page_size):
+        """the page of a cached id list after or before the cursor, found by position"""
+        ids = rows.ids
+        if direction is not None and not isinstance(position, int):
+            raise NotFound(self.invalid_cursor_message)
+        if direction is not None:
+            # the list is replaced when its cache entry expires, look the id up again then
+            if not (0 <= position < len(ids) and ids[position] == pk) and pk in ids:
+                position = ids.index(pk)
+
+        if direction == 'previous':
+            end = max(position, 0)
+            start = max(end - page_size, 0)
+            has_more = start > 0
+        else:
+            start = 0 if direction is None else position + 1
+            end = start + page_size
+            has_more = end < len(ids)
+
+        keys = [(index, ids[index]) for index in range(start, min(end, len(ids)))]
+        return rows[start:end], keys, has_more
+
+    def seek_queryset(self, queryset, keyset_field, direction, value, pk, page_size):
+        """the page of a queryset after or before the cursor, one query with a LIMIT"""
+        # NULLs can't be compared, they sort as empty strings instead
+        queryset = queryset.annotate(keyset_value=Coalesce(Lower(keyset_field), Value('')))
+        if direction == 'next':
+            queryset = queryset.filter(Q(keyset_value__gt=value) | Q(keyset_value=value, pk__gt=pk))
+        elif direction == 'previous':
+            queryset = queryset.filter(Q(keyset_value__lt=value) | Q(keyset_value=value, pk__lt=pk))
+
+        if direction == 'previous':
+            queryset = queryset.order_by('-keyset_value', '-pk')
+        else:
+            queryset = queryset.order_by('keyset_value', 'pk')
+
+        page = list(queryset[:page_size + 1])
+        has_more = len(page) > page_size
+        page = page[:page_size]
+        if direction == 'previous':
+            page.reverse()
+        return page, [(row.keyset_value, row.pk) for row in page], has_more
+
+    def encode_cursor(self, direction, position, pk):
+        data = json.dumps([direction, position, pk], separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """(direction, sort value or list position, id), direction is None for the first page"""
+        if not cursor:
+            return None, None, None
+        try:
+            data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, position, pk = json.loads(data)
+        except (ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if direction not in ('next', 'previous') or not isinstance(pk, int):
+            raise NotFound(self.invalid_cursor_message)
+        return direction, position, pk
+
+    def cursor_link(self, cursor):
+        if cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
 
     def get_paginated_response(self, data):
         client_page_size = self.request.query_params.get(self.page_size_query_param)
         page_size = int(client_page_size) if client_page_size else self.page_size
 
+        if self.keyset:
+            return Response({
+                'links': {
+                    'next': self.cursor_link(self.next_cursor),
+                    'previous': self.cursor_link(self.previous_cursor)
+                },
+                'count': self.count,
+                'count_exact': self.count_exact,
+                'total_pages': ceil(self.count / page_size),
+                'results': data
+            })
+
         return Response({
             'links': {
                 'next': self.get_next_link(),
                 'previous': self.get_previous_link()
             },
             'count': self.page.paginator.count,
+            'count_exact': self.page.paginator.count_exact,
             'total_pages': ceil(self.page.paginator.count / page_size),
             'results': data
-        })
\ No newline at end of file
+        })
+
+def cached_ids(cache_key, queryset, timeout=300):
+    """the ordered pks of the queryset, cached instead of the rows themselves (see CachedIdsMixin)"""
+    ids = cache.get(cache_key)
+    if ids is None:
+        # prefetches only matter for the pages, not for the ids
+        ids = list(queryset.prefetch_related(None).values_list('pk', flat=True))
+        cache.set(cache_key, ids, timeout=timeout)
+    return ids
+
+class hydrated_ids:
+    """
+    an ordered id list as a sequence paginators can count and slice, every slice
+    loaded with one id__in query plus the queryset's select_related/prefetch_related.
+    Rows deleted since the ids were cached are left out of the page, and an integer
+    index gives the first row still there from that position on
+    """
+    # ids read per query when an integer index has to skip deleted rows
+    skip_chunk_size = 100
+
+    def __init__(self, ids, queryset):
+        self.ids = ids
+        self.queryset = queryset
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            # raises IndexError out of range, negative indexes count from the end
+            position = range(len(self.ids))[index]
+            for start in range(position, len(self.ids), self.skip_chunk_size):
+                rows = self[start:start + self.skip_chunk_size]
+                if rows:
+                    return rows[0]
+            raise IndexError("hydrated_ids index out of range, the remaining rows were deleted")
+        ids = self.ids[index]
+        rows = self.queryset.in_bulk(ids) if ids else {}
+        return [rows[pk] for pk in ids if pk in rows]
+
+class CachedIdsMixin:
+    """
+    lists a viewset's get_queryset() from a cached, ordered id list per
+    (page_language, query) and list version, so the cache holds a list of
+    ints per key and each page is read fresh from the database
+    """
+    cache_prefix = None
+
+    def cached_rows(self, **filters):
+        """get_queryset() filtered by filters, as a hydrated_ids sequence"""
+        page_language = self.request.query_params.get('page_language', 'en')
+        query = self.request.query_params.get('query', '')
+        queryset = self.get_queryset().filter(**filters)
+        cache_key = f'{self.cache_prefix}_ids_{list_version(queryset.model)}_{page_language}_{query}'
+        for field, value in sorted(filters.items()):
+            cache_key += f'_{field}={value}'
+
+        return hydrated_ids(cached_ids(cache_key, queryset), queryset)
+
+    def list(self, request, *args, **kwargs):
+        rows = self.cached_rows()
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(rows[:], many=True).data)
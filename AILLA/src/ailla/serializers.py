@@ -2,6 +2,10 @@ from django.apps import apps
 from rest_framework import serializers
 from datetime import datetime
 from .models import *
+from .authority_snapshots import (
+    languages_snapshot, countries_snapshot, organizations_snapshot,
+    media_content_types_snapshot, genres_snapshot, participant_roles_snapshot, original_media_types_snapshot,
+)
 
 class DefaultSerializer(serializers.ModelSerializer):
     class Meta:
@@ -13,6 +17,20 @@ class TextSerializer(serializers.ModelSerializer):
         model = Text
         fields = ['id', 'en','es','pt']
 
+class SnapshotSerializerMixin:
+    """
+    reads the fields of a nested authority or vocabulary record from its snapshot
+    (see authority_snapshots.py), so its Text relations are never queried
+    """
+    snapshot = None
+
+    def to_representation(self, instance):
+        data = self.snapshot.serialize(instance.pk, self.Meta.fields)
+        if data is None:
+            # created in a transaction that hasn't committed yet
+            return super().to_representation(instance)
+        return data
+
 class SolrTextSerializer(serializers.ModelSerializer):
     """returns one string value, determined by context, used for solr"""
     class Meta:
@@ -25,7 +43,8 @@ class SolrTextSerializer(serializers.ModelSerializer):
         data = super().to_representation(instance)
         return data[field]
 
-class SimpleCountriesSerializer(serializers.ModelSerializer):
+class SimpleCountriesSerializer(SnapshotSerializerMixin, serializers.ModelSerializer):
+    snapshot = countries_snapshot
     name = TextSerializer()
 
     class Meta:
@@ -80,7 +99,8 @@ class CountriesSerializer(serializers.ModelSerializer):
 
         return super().update(instance, validated_data)
 
-class SimpleLanguagesSerializer(serializers.ModelSerializer):
+class SimpleLanguagesSerializer(SnapshotSerializerMixin, serializers.ModelSerializer):
+    snapshot = languages_snapshot
     name = TextSerializer(read_only=True)
 
     class Meta:
@@ -161,7 +181,8 @@ class SolrLanguagesSerializer(serializers.ModelSerializer):
 
         return data[field]
 
-class SimpleOrganizationsSerializer(serializers.ModelSerializer):
+class SimpleOrganizationsSerializer(SnapshotSerializerMixin, serializers.ModelSerializer):
+    snapshot = organizations_snapshot
     org_name = TextSerializer()
 
     class Meta:
@@ -322,7 +343,8 @@ class ContributorRoleSerializer(serializers.ModelSerializer):
         fields = '__all__'
         depth = 0
 
-class SimpleGenreSerializer(serializers.ModelSerializer):
+class SimpleGenreSerializer(SnapshotSerializerMixin, serializers.ModelSerializer):
+    snapshot = genres_snapshot
     name = TextSerializer()
 
     class Meta:
@@ -424,7 +446,8 @@ class MediaContentTypeSerializer(serializers.ModelSerializer):
 
         return super().update(instance, validated_data)
     
-class MediaContentTypeNameSerializer(serializers.ModelSerializer):
+class MediaContentTypeNameSerializer(SnapshotSerializerMixin, serializers.ModelSerializer):
+    snapshot = media_content_types_snapshot
     name = TextSerializer()
 
     class Meta:
@@ -486,7 +509,8 @@ class ParticipantRolesSerializer(serializers.ModelSerializer):
 
         return super().update(instance, validated_data)
     
-class ParticipantRolesNameSerializer(serializers.ModelSerializer):
+class ParticipantRolesNameSerializer(SnapshotSerializerMixin, serializers.ModelSerializer):
+    snapshot = participant_roles_snapshot
     name = TextSerializer()
 
     class Meta:
@@ -533,7 +557,8 @@ class OriginalMediaTypeSerializer(serializers.ModelSerializer):
 
         return super().update(instance, validated_data)
     
-class OriginalMediaTypeNameSerializer(serializers.ModelSerializer):
+class OriginalMediaTypeNameSerializer(SnapshotSerializerMixin, serializers.ModelSerializer):
+    snapshot = original_media_types_snapshot
     name = TextSerializer()
 
     class Meta:
@@ -4,7 +4,8 @@ from rest_framework import serializers
 from .models import *
 from .serializers import *
 from .serializers_folders import FoldersSerializer
-from .solr import solr
+from .solr_documents import solr_datetime
+from .solr import solr, add_facets, content_hash, CONTENT_HASH_FIELD
 
 class SimpleCollectionsSerializer(serializers.ModelSerializer):
     title = TextSerializer(required=False)
@@ -47,6 +48,24 @@ class FastCollectionsSerializer(serializers.ModelSerializer):
             collectors.append({"type": "depositor", "model": "organizations", "id":organization.id, "en":organization.org_name.en, "es":organization.org_name.es, "pt":organization.org_name.pt})
         return collectors
 
+class CollectionCardsSerializer(FastCollectionsSerializer):
+    """what a collection card on a list page shows, stored in CollectionCards.data"""
+    collection_languages = SimpleLanguagesSerializer(many=True, read_only=True)
+    countries = SimpleCountriesSerializer(many=True, read_only=True)
+
+    class Meta(FastCollectionsSerializer.Meta):
+        fields = [
+            "id",
+            "title",
+            "collection_languages",
+            "countries",
+            "description",
+            "last_updated",
+            "contributors"
+        ]
+        read_only_fields = fields
+        depth = 0
+
 class CollectionsSerializer(serializers.ModelSerializer):
     title = TextSerializer(required=False)
     description = TextSerializer(required=False)
@@ -143,6 +162,24 @@ class CollectionsSerializer(serializers.ModelSerializer):
 
         return collection
 
+class CollectionJobsSerializer(serializers.ModelSerializer):
+    """progress of a background publish/unpublish job"""
+    class Meta:
+        model = CollectionJobs
+        fields = [
+            "id",
+            "job_type",
+            "collection",
+            "status",
+            "total",
+            "processed",
+            "failures",
+            "errors",
+            "created",
+            "last_updated",
+        ]
+        read_only_fields = fields
+
 class CollectionsSolrSerializer(serializers.ModelSerializer):
     """Outputs a collection in a flattened json format that is ready to be sent to Solr"""
     title_en = SolrTextSerializer(source="title", context="en")
@@ -235,7 +272,10 @@ class CollectionsSolrSerializer(serializers.ModelSerializer):
     def to_representation(self, obj:Collections):
         """Adds some additional metadata not held in model"""
         solr_data = super().to_representation(obj)
-        solr_data["last_updated"] = convert_to_utc(solr_data["last_updated"]) if solr_data.get("last_updated") else None
+        solr_data["last_updated"] = solr_datetime(obj.last_updated) if obj.last_updated else None
         solr_data["model"] = Collections.__name__
         solr_data["id"] = obj.get_solr_id()
+        add_facets(solr_data)
+        # lets solr_index --changed-only skip documents solr already has
+        solr_data[CONTENT_HASH_FIELD] = content_hash(solr_data)
         return solr_data
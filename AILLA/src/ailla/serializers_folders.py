@@ -4,7 +4,8 @@ from django.apps import apps
 from rest_framework import serializers
 from .models import *
 from .serializers import *
-from .solr import solr
+from .solr import solr, add_facets, content_hash, CONTENT_HASH_FIELD
+from .solr_documents import folder_document, solr_datetime
 from core.logger import logger
 from django.db import transaction
 
@@ -118,7 +119,7 @@ class FoldersSerializer(serializers.ModelSerializer):
 
         # Add to Solr metadata if not a draft
         if validated_data['draft'] is False:
-            solr_data = FoldersSolrSerializer(folder).data
+            solr_data = folder_document(folder)
             solr.add(solr_data)
 
         return folder
@@ -167,7 +168,7 @@ class FoldersSerializer(serializers.ModelSerializer):
 
         # Update Solr metadata if not a draft
         if instance.draft is False:
-            solr_data = FoldersSolrSerializer(instance).data
+            solr_data = folder_document(instance)
             solr.add(solr_data)
 
         return super().update(instance, validated_data)
@@ -260,7 +261,10 @@ class FoldersSolrSerializer(serializers.ModelSerializer):
     def to_representation(self, obj:Folders):
         """Adds some additional metadata not held in model"""
         solr_data = super().to_representation(obj)
-        solr_data["last_updated"] = convert_to_utc(solr_data["last_updated"]) if solr_data.get("last_updated") else None
+        solr_data["last_updated"] = solr_datetime(obj.last_updated) if obj.last_updated else None
         solr_data["model"] = Folders.__name__
         solr_data["id"] = obj.get_solr_id()
+        add_facets(solr_data)
+        # lets solr_index --changed-only skip documents solr already has
+        solr_data[CONTENT_HASH_FIELD] = content_hash(solr_data)
         return solr_data
@@ -1,7 +1,14 @@
+import hashlib
+import json
 import pysolr
 import os
+import unicodedata
 
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from unidecode import unidecode
+
+from .deferred import on_commit_batch
 
 """Solr connection instance using environement settings: SOLR_URL and SOLR_COLLECTION"""
 solr = pysolr.Solr(
@@ -10,3 +17,114 @@ solr = pysolr.Solr(
     timeout=30,
     auth=None,
 )
+
+def add_in_batches(docs, batch_size=500, on_batch=None):
+    """Sends an iterable of documents to solr batch_size at a time, committing once at the end
+
+    If on_batch is given it is called as on_batch(number of docs, error) after every batch,
+    and a batch that solr rejects is reported to it instead of raising.
+
+    Returns:
+        int: number of documents sent
+    """
+    counter = 0
+
+    def send(batch):
+        try:
+            solr.add(batch, commit=False)
+        except pysolr.SolrError as e:
+            if on_batch is None:
+                raise
+            on_batch(len(batch), e)
+            return 0
+        if on_batch is not None:
+            on_batch(len(batch), None)
+        return len(batch)
+
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            counter += send(batch)
+            batch = []
+
+    if batch:
+        counter += send(batch)
+    solr.commit()
+    return counter
+
+# solr ids deleted during the current transaction
+solr_deletes = on_commit_batch(lambda solr_ids: solr.delete(id=solr_ids), "solr deletes")
+
+def delete_on_commit(solr_ids):
+    """Remove documents from solr once the surrounding DB transaction commits, in one request per transaction."""
+    solr_deletes.add(solr_ids)
+
+# solr field holding the hash of the rest of the document
+CONTENT_HASH_FIELD = "content_hash"
+
+def content_hash(solr_data:dict):
+    """stable hash of a serialized solr document, ignoring key order and any existing hash"""
+    doc = {key: value for key, value in solr_data.items() if key != CONTENT_HASH_FIELD}
+    encoded = json.dumps(doc, cls=DjangoJSONEncoder, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.blake2b(encoded.encode("utf-8"), digest_size=16).hexdigest()
+
+# facet fields searched by AuthorityFileFacetsView, each built from the list field it summarizes.
+# contributors_* come from the items documents
+FACET_FIELDS = {
+    "collectors_orgs_en_facet": "collectors_orgs_en",
+    "collectors_orgs_es_facet": "collectors_orgs_es",
+    "collectors_orgs_pt_facet": "collectors_orgs_pt",
+    "collectors_persons_facet": "collectors_persons",
+    "contributors_orgs_en_facet": "contributors_orgs_en",
+    "contributors_orgs_es_facet": "contributors_orgs_es",
+    "contributors_orgs_pt_facet": "contributors_orgs_pt",
+    "contributors_persons_facet": "contributors_persons",
+    "countries_en_facet": "countries_en",
+    "countries_es_facet": "countries_es",
+    "countries_pt_facet": "countries_pt",
+    "languages_en_facet": "languages_en",
+    "languages_es_facet": "languages_es",
+    "languages_pt_facet": "languages_pt",
+}
+
+def facet_key(value:str):
+    """what two facet values must share to count as the same term: case and diacritics are ignored"""
+    return unidecode(value).casefold()
+
+def facet_values(values):
+    """
+    the distinct facet terms of a list of field values, in order
+
+    Values are NFC normalized with whitespace collapsed, empty ones are dropped, and values
+    differing only in case or diacritics are kept once, as first written.
+    """
+    terms = {}
+    for value in values or ():
+        if value is None:
+            continue
+        term = " ".join(unicodedata.normalize("NFC", str(value)).split())
+        if term:
+            terms.setdefault(facet_key(term), term)
+    return list(terms.values())
+
+def add_facets(solr_data:dict):
+    """sets every facet field whose source field is in the document"""
+    for facet_field, source_field in FACET_FIELDS.items():
+        if source_field in solr_data:
+            solr_data[facet_field] = facet_values(solr_data[source_field])
+    return solr_data
+
+def fetch_content_hashes(rows=5000):
+    """returns {solr id: content hash} for every document in solr, read with a cursor"""
+    hashes = {}
+    cursor = "*"
+    while True:
+        results = solr.search("*:*", fl=f"id,{CONTENT_HASH_FIELD}", sort="id asc", rows=rows, cursorMark=cursor)
+        for doc in results.docs:
+            hashes[doc["id"]] = doc.get(CONTENT_HASH_FIELD)
+
+        if not results.nextCursorMark or results.nextCursorMark == cursor:
+            break
+        cursor = results.nextCursorMark
+    return hashes
@@ -0,0 +1,346 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import timezone as dt_timezone
+
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import *
+from .serializers import *
+from .solr import add_facets, content_hash, CONTENT_HASH_FIELD
+from .authority_updates import AUTHORITY_LOOKUPS, solr_values, to_str
+
+"""
+Flat solr document builders for Collections and Folders.
+
+These produce exactly the same documents as CollectionsSolrSerializer and FoldersSolrSerializer,
+but visit each related object once and emit all of its language variants in the same pass,
+instead of running a nested serializer per language and keeping one key. Use them anywhere
+documents are built in bulk; the serializers remain as the readable definition of the fields.
+
+bulk_documents goes one step further for full rebuilds: it reads plain values() rows for a chunk
+of pks, with the relation tables and authority records fetched once per chunk, and joins them
+with dict lookups, so no model instances are created at all.
+"""
+
+LANGUAGES = ("en", "es", "pt")
+
+def solr_datetime(value):
+    """a datetime as the UTC timestamp solr date fields take, like 2024-01-31T18:00:00Z"""
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value.astimezone(dt_timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def add_text(doc, prefix, text:Text):
+    """prefix_en/_es/_pt from a Text, like SolrTextSerializer"""
+    if text is None:
+        for language in LANGUAGES:
+            doc[f"{prefix}_{language}"] = None
+    else:
+        doc[f"{prefix}_en"] = to_str(text.en)
+        doc[f"{prefix}_es"] = to_str(text.es)
+        doc[f"{prefix}_pt"] = to_str(text.pt)
+
+class authority_memo:
+    """
+    bounded LRU cache of authority records (languages, countries, organizations, persons)
+    to the strings they contribute to a solr document
+
+    Keyed by model, pk and last_updated, so an edited record gets a new entry.
+    """
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, obj, build):
+        """the cached value for obj, or build(obj) if it isn't cached yet"""
+        key = (type(obj), obj.pk, getattr(obj, "last_updated", None))
+        try:
+            value = self.values[key]
+        except KeyError:
+            self.misses += 1
+            value = self.values[key] = build(obj)
+            if len(self.values) > self.maxsize:
+                self.values.popitem(last=False)
+            return value
+
+        self.hits += 1
+        self.values.move_to_end(key)
+        return value
+
+# the memo of the indexing run in progress on this thread, if any
+_run = threading.local()
+
+@contextmanager
+def memoized_authorities(maxsize=10000):
+    """
+    Within the block, each authority record is converted to its solr strings once
+    instead of once per document that references it.
+
+    Usage::
+
+        with memoized_authorities() as memo:
+            docs = [collection_document(collection) for collection in collections]
+    """
+    outer = getattr(_run, "memo", None)
+    if outer is not None:
+        yield outer
+        return
+
+    _run.memo = authority_memo(maxsize)
+    try:
+        yield _run.memo
+    finally:
+        _run.memo = None
+
+def memoized(obj, build):
+    """build(obj), through the run's memo when one is active"""
+    memo = getattr(_run, "memo", None)
+    if memo is None:
+        return build(obj)
+    return memo.get(obj, build)
+
+def name_values(obj, name_attribute, code_attribute=None):
+    """(en, es, pt, code) of an authority record"""
+    name = getattr(obj, name_attribute)
+    code = to_str(getattr(obj, code_attribute)) if code_attribute is not None else None
+    if name is None:
+        return (None, None, None, code)
+    return (to_str(name.en), to_str(name.es), to_str(name.pt), code)
+
+def add_language(doc, prefix, language:Languages):
+    """prefix_en/_es/_pt/_code from a single language, like SolrLanguagesSerializer"""
+    if language is None:
+        values = (None, None, None, None)
+    else:
+        values = memoized(language, lambda language: name_values(language, "name", "language_code"))
+
+    doc[f"{prefix}_en"], doc[f"{prefix}_es"], doc[f"{prefix}_pt"], doc[f"{prefix}_code"] = values
+
+def add_names(doc, prefix, related, name_attribute, code_attribute=None):
+    """prefix_en/_es/_pt (and prefix_codes) lists from a many relation, in one pass over it"""
+    build = lambda obj: name_values(obj, name_attribute, code_attribute)
+    en, es, pt, codes = [], [], [], []
+    for obj in related.all():
+        values = memoized(obj, build)
+        en.append(values[0])
+        es.append(values[1])
+        pt.append(values[2])
+        codes.append(values[3])
+
+    doc[f"{prefix}_en"] = en
+    doc[f"{prefix}_es"] = es
+    doc[f"{prefix}_pt"] = pt
+    if code_attribute is not None:
+        doc[f"{prefix}_codes"] = codes
+
+def person_name(person:Persons):
+    return f"{to_str(person.given_name)} {to_str(person.surname)}"
+
+def persons(related):
+    """given name and surname as one string per person, like SolrPersonsSerializer"""
+    return [memoized(person, person_name) for person in related.all()]
+
+def add_common(doc, obj):
+    """the title/description fields shared by collections and folders"""
+    doc["pk"] = obj.pk
+    doc["islandora_pid"] = to_str(obj.islandora_pid)
+    doc["legacy_id"] = to_str(obj.legacy_id)
+
+    add_text(doc, "title", obj.title)
+    doc["title_indig"] = to_str(obj.indigenous_title)
+    add_language(doc, "title_indig_language", obj.lang_indigenous_title)
+
+    add_text(doc, "description", obj.description)
+    doc["description_indig"] = to_str(obj.indigenous_description)
+    add_language(doc, "description_indig_language", obj.lang_indigenous_description)
+
+def finish(doc, obj, model):
+    """the metadata the serializers add in to_representation"""
+    return finish_values(doc, obj.pk, obj.last_updated, model)
+
+def finish_values(doc, pk, last_updated, model):
+    """finish() from plain values"""
+    doc["last_updated"] = solr_datetime(last_updated) if last_updated else None
+    doc["model"] = model.__name__
+    doc["id"] = f"{pk}:{model.__name__}"
+    add_facets(doc)
+    doc[CONTENT_HASH_FIELD] = content_hash(doc)
+    return doc
+
+def collection_document(collection:Collections):
+    """same output as CollectionsSolrSerializer(collection).data"""
+    doc = {}
+    add_common(doc, collection)
+
+    doc["collectors_persons"] = persons(collection.collectors_persons)
+    add_names(doc, "collectors_orgs", collection.collectors_orgs, "org_name")
+    doc["depositors_persons"] = persons(collection.depositors_persons)
+    add_names(doc, "depositors_orgs", collection.depositors_orgs, "org_name")
+
+    add_names(doc, "countries", collection.countries, "name", "country_code")
+    add_names(doc, "languages", collection.collection_languages, "name", "language_code")
+
+    return finish(doc, collection, Collections)
+
+def folder_document(folder:Folders):
+    """same output as FoldersSolrSerializer(folder).data"""
+    doc = {}
+    add_common(doc, folder)
+
+    add_names(doc, "countries", folder.countries, "name", "country_code")
+    add_names(doc, "languages", folder.subject_languages, "name", "language_code")
+
+    return finish(doc, folder, Folders)
+
+def collection_documents_queryset():
+    """Collections with everything collection_document reads loaded up front"""
+    return Collections.objects.select_related(
+        'title',
+        'description',
+        'lang_indigenous_title__name',
+        'lang_indigenous_description__name',
+    ).prefetch_related(
+        'collectors_persons',
+        Prefetch('collectors_orgs', queryset=Organizations.objects.select_related('org_name')),
+        'depositors_persons',
+        Prefetch('depositors_orgs', queryset=Organizations.objects.select_related('org_name')),
+        Prefetch('countries', queryset=Countries.objects.select_related('name')),
+        Prefetch('collection_languages', queryset=Languages.objects.select_related('name')),
+    )
+
+def folder_documents_queryset():
+    """Folders with everything folder_document reads loaded up front"""
+    return Folders.objects.select_related(
+        'title',
+        'description',
+        'lang_indigenous_title__name',
+        'lang_indigenous_description__name',
+    ).prefetch_related(
+        Prefetch('countries', queryset=Countries.objects.select_related('name')),
+        Prefetch('subject_languages', queryset=Languages.objects.select_related('name')),
+    )
+
+
+# For each bulk indexed model: (relation, solr field prefix) of the many relations it embeds,
+# named like collection_document and folder_document name them
+BULK_RELATIONS = {
+    Collections: [
+        ("collectors_persons", "collectors_persons"),
+        ("collectors_orgs", "collectors_orgs"),
+        ("depositors_persons", "depositors_persons"),
+        ("depositors_orgs", "depositors_orgs"),
+        ("countries", "countries"),
+        ("collection_languages", "languages"),
+    ],
+    Folders: [
+        ("countries", "countries"),
+        ("subject_languages", "languages"),
+    ],
+}
+
+# single languages shared by collections and folders: (relation, solr field prefix)
+BULK_LANGUAGES = [
+    ("lang_indigenous_title", "title_indig_language"),
+    ("lang_indigenous_description", "description_indig_language"),
+]
+
+class bulk_documents:
+    """
+    builds the solr documents of a model for a chunk of pks from values() queries
+
+    Every chunk costs one query for the rows, one per relation table and one per authority model
+    with records not seen earlier in the run; authority values are kept for the life of the builder.
+
+    Usage::
+
+        builder = bulk_documents(Collections)
+        for pks in chunks:
+            docs = builder.build(pks)
+    """
+    def __init__(self, model):
+        self.model = model
+        self.relations = [
+            (model._meta.get_field(relation), prefix) for relation, prefix in BULK_RELATIONS[model]
+        ]
+        # {authority model: {pk: looked up values}}
+        self.authorities = {}
+
+    def build(self, pks):
+        """the documents for the given pks, in pk order, skipping pks that don't exist"""
+        return self.assemble(self.load(pks))
+
+    def load(self, pks):
+        """reads everything the chunk's documents need, returns (rows, {relation: {pk: [target pks]}})"""
+        rows = list(self.model.objects.filter(pk__in=pks).order_by("pk").values(
+            "pk",
+            "islandora_pid",
+            "legacy_id",
+            "title__en", "title__es", "title__pt",
+            "indigenous_title",
+            "description__en", "description__es", "description__pt",
+            "indigenous_description",
+            "last_updated",
+            *[f"{relation}_id" for relation, prefix in BULK_LANGUAGES],
+        ))
+        pks = [row["pk"] for row in rows]
+
+        targets = {}
+        for field, prefix in self.relations:
+            through = field.remote_field.through
+            source = field.m2m_field_name()
+            target = field.m2m_reverse_field_name()
+            by_pk = targets[field.name] = {}
+            for pk, target_pk in through.objects.filter(**{f"{source}_id__in": pks}).order_by(f"{source}_id", f"{target}_id").values_list(f"{source}_id", f"{target}_id"):
+                by_pk.setdefault(pk, []).append(target_pk)
+            self.load_authorities(field.related_model, {target_pk for target_pks in by_pk.values() for target_pk in target_pks})
+
+        self.load_authorities(Languages, {row[f"{relation}_id"] for row in rows for relation, prefix in BULK_LANGUAGES} - {None})
+        return rows, targets
+
+    def load_authorities(self, model, pks):
+        """fetch the values of the authority records that aren't known yet"""
+        known = self.authorities.setdefault(model, {})
+        missing = [pk for pk in pks if pk not in known]
+        if missing:
+            for pk, *row in model.objects.filter(pk__in=missing).values_list("pk", *AUTHORITY_LOOKUPS[model]):
+                known[pk] = row
+
+    def assemble(self, loaded):
+        """join the loaded rows into solr documents"""
+        rows, targets = loaded
+        languages = self.authorities.get(Languages, {})
+        docs = []
+        for row in rows:
+            doc = {
+                "pk": row["pk"],
+                "islandora_pid": to_str(row["islandora_pid"]),
+                "legacy_id": to_str(row["legacy_id"]),
+                "title_en": to_str(row["title__en"]),
+                "title_es": to_str(row["title__es"]),
+                "title_pt": to_str(row["title__pt"]),
+                "title_indig": to_str(row["indigenous_title"]),
+                "description_en": to_str(row["description__en"]),
+                "description_es": to_str(row["description__es"]),
+                "description_pt": to_str(row["description__pt"]),
+                "description_indig": to_str(row["indigenous_description"]),
+            }
+            for relation, prefix in BULK_LANGUAGES:
+                language_id = row[f"{relation}_id"]
+                values = languages[language_id] if language_id is not None else [None] * len(AUTHORITY_LOOKUPS[Languages])
+                doc.update(solr_values(Languages, prefix, False, [to_str(value) for value in values]))
+
+            for field, prefix in self.relations:
+                model = field.related_model
+                authorities = self.authorities[model]
+                fields = {solr_field: [] for solr_field in solr_values(model, prefix, True, [None] * len(AUTHORITY_LOOKUPS[model]))}
+                for target_pk in targets[field.name].get(row["pk"], ()):
+                    for solr_field, value in solr_values(model, prefix, True, authorities[target_pk]).items():
+                        fields[solr_field].append(to_str(value))
+                doc.update(fields)
+
+            docs.append(finish_values(doc, row["pk"], row["last_updated"], self.model))
+        return docs
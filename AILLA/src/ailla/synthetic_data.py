@@ -0,0 +1,200 @@
+import random
+
+from unidecode import unidecode
+
+from .models import *
+
+"""
+Deterministic synthetic data for benchmarks.
+
+generate() fills the database with trilingual Text, authority records and published
+Collections -> Folders -> Items -> Files trees. The same scale and seed always produce the same
+rows, so timings from different runs and machines can be compared. Everything is written
+with bulk_create, so run it inside a transaction you roll back, as solr_benchmark does.
+"""
+
+# number of folders (the bulk of the indexed documents) for each named scale
+SCALES = {
+    "1k": 1000,
+    "10k": 10000,
+    "100k": 100000,
+}
+
+FOLDERS_PER_COLLECTION = 20
+ITEMS_PER_FOLDER = 2
+FILES_PER_ITEM = 1
+
+# words with and without diacritics, so the *_neutral fields differ from the originals
+WORDS = {
+    "en": ["song", "story", "language", "prayer", "recording", "village", "river", "market", "elder", "festival"],
+    "es": ["canción", "cuento", "lengua", "oración", "grabación", "pueblo", "río", "mercado", "anciano", "fiesta"],
+    "pt": ["canção", "história", "língua", "oração", "gravação", "aldeia", "rio", "mercado", "ancião", "festa"],
+}
+
+BATCH_SIZE = 2000
+
+class text_factory:
+    """creates trilingual Text rows in bulk"""
+    def __init__(self, rng:random.Random):
+        self.rng = rng
+
+    def build(self, label):
+        """an unsaved Text with a few random words per language"""
+        words = [self.rng.randrange(len(WORDS["en"])) for _ in range(self.rng.randint(2, 6))]
+        values = {}
+        for language, vocabulary in WORDS.items():
+            value = " ".join(vocabulary[word] for word in words) + f" {label}"
+            values[language] = value
+            values[f"{language}_neutral"] = unidecode(value)
+        return Text(**values)
+
+    def create(self, labels):
+        """saved Texts, one per label"""
+        return Text.objects.bulk_create([self.build(label) for label in labels], batch_size=BATCH_SIZE)
+
+def link(relation, rows):
+    """bulk insert (source, target) pairs into the through table of a many to many field"""
+    field = relation.field
+    through = field.remote_field.through
+    source = field.m2m_field_name()
+    target = field.m2m_reverse_field_name()
+    through.objects.bulk_create(
+        [through(**{f"{source}_id": source_pk, f"{target}_id": target_pk}) for source_pk, target_pk in rows],
+        batch_size=BATCH_SIZE,
+    )
+
+def sample_links(rng:random.Random, sources, targets, low, high):
+    """(source pk, target pk) pairs linking each source to between low and high distinct targets"""
+    return [
+        (source.pk, target.pk)
+        for source in sources
+        for target in rng.sample(targets, rng.randint(low, high))
+    ]
+
+def generate(scale, seed=1):
+    """
+    creates a synthetic archive with the given number of folders
+
+    Returns:
+        dict: number of rows created per model
+    """
+    rng = random.Random(seed)
+    texts = text_factory(rng)
+    n_folders = SCALES.get(scale, scale)
+    n_collections = max(1, n_folders // FOLDERS_PER_COLLECTION)
+
+    # authority records and vocabularies, sized like a real archive rather than with the scale
+    countries = Countries.objects.bulk_create([
+        Countries(name=name, country_code=f"C{i:02d}")
+        for i, name in enumerate(texts.create(f"country {i}" for i in range(50)))
+    ])
+    language_names = texts.create(f"language {i}" for i in range(300))
+    language_descriptions = texts.create(f"language description {i}" for i in range(300))
+    languages = Languages.objects.bulk_create([
+        Languages(name=name, description=description, language_code=f"l{i:03d}", macro_language=False)
+        for i, (name, description) in enumerate(zip(language_names, language_descriptions))
+    ])
+    org_names = texts.create(f"organization {i}" for i in range(200))
+    org_descriptions = texts.create(f"organization description {i}" for i in range(200))
+    organizations = Organizations.objects.bulk_create([
+        Organizations(org_name=name, description=description, acronym=f"O{i}", depositor_status=rng.random() < 0.3)
+        for i, (name, description) in enumerate(zip(org_names, org_descriptions))
+    ])
+    persons = Persons.objects.bulk_create([
+        Persons(given_name=f"Given{i}", surname=f"Súrname{i}", depositor_status=rng.random() < 0.3)
+        for i in range(1000)
+    ], batch_size=BATCH_SIZE)
+    genres = Genre.objects.bulk_create([
+        Genre(name=name, description=description)
+        for name, description in zip(texts.create(f"genre {i}" for i in range(20)), texts.create(f"genre description {i}" for i in range(20)))
+    ])
+    roles = ParticipantRoles.objects.bulk_create([
+        ParticipantRoles(name=name, description=description)
+        for name, description in zip(texts.create(f"role {i}" for i in range(10)), texts.create(f"role description {i}" for i in range(10)))
+    ])
+
+    # collections
+    titles = texts.create(f"collection {i}" for i in range(n_collections))
+    descriptions = texts.create(f"collection description {i}" for i in range(n_collections))
+    collections = Collections.objects.bulk_create([
+        Collections(
+            title=title,
+            description=description,
+            legacy_id=f"COL{i:05d}",
+            indigenous_title=f"indigenous title {i}",
+            lang_indigenous_title=rng.choice(languages),
+            lang_indigenous_description=rng.choice(languages),
+            fedora_uuid=f"collection-{i}",
+            draft=False,
+        )
+        for i, (title, description) in enumerate(zip(titles, descriptions))
+    ], batch_size=BATCH_SIZE)
+    link(Collections.collectors_persons, sample_links(rng, collections, persons, 1, 3))
+    link(Collections.collectors_orgs, sample_links(rng, collections, organizations, 0, 2))
+    link(Collections.depositors_persons, sample_links(rng, collections, persons, 1, 2))
+    link(Collections.depositors_orgs, sample_links(rng, collections, organizations, 0, 1))
+    link(Collections.collection_languages, sample_links(rng, collections, languages, 1, 4))
+    link(Collections.countries, sample_links(rng, collections, countries, 1, 2))
+
+    # folders
+    titles = texts.create(f"folder {i}" for i in range(n_folders))
+    descriptions = texts.create(f"folder description {i}" for i in range(n_folders))
+    folders = Folders.objects.bulk_create([
+        Folders(
+            title=title,
+            description=description,
+            parent_collection=collections[i % n_collections],
+            legacy_id=f"FOL{i:06d}",
+            indigenous_title=f"indigenous title {i}",
+            lang_indigenous_title=rng.choice(languages),
+            lang_indigenous_description=rng.choice(languages),
+            fedora_uuid=f"folder-{i}",
+            draft=False,
+        )
+        for i, (title, description) in enumerate(zip(titles, descriptions))
+    ], batch_size=BATCH_SIZE)
+    link(Folders.subject_languages, sample_links(rng, folders, languages, 1, 3))
+    link(Folders.countries, sample_links(rng, folders, countries, 1, 2))
+
+    # items
+    n_items = n_folders * ITEMS_PER_FOLDER
+    names = texts.create(f"item {i}" for i in range(n_items))
+    descriptions = texts.create(f"item description {i}" for i in range(n_items))
+    items = Items.objects.bulk_create([
+        Items(
+            name=name,
+            description=description,
+            parent_folder=folders[i // ITEMS_PER_FOLDER],
+            legacy_id=f"ITM{i:07d}",
+            lang_indigenous_name=rng.choice(languages),
+            fedora_uuid=f"item-{i}",
+            visibility=Items.Visibility.PUBLIC,
+            draft=False,
+        )
+        for i, (name, description) in enumerate(zip(names, descriptions))
+    ], batch_size=BATCH_SIZE)
+    link(Items.genre, sample_links(rng, items, genres, 1, 2))
+    ContributorRole.objects.bulk_create([
+        ContributorRole(item=item, role_name=rng.choice(roles), **(
+            {"person": rng.choice(persons)} if rng.random() < 0.8 else {"organization": rng.choice(organizations)}
+        ))
+        for item in items
+    ], batch_size=BATCH_SIZE)
+
+    # files
+    files = File.objects.bulk_create([
+        File(parent_item=items[i // FILES_PER_ITEM], legacy_id=f"FIL{i:07d}", filename=f"file_{i}.wav", media_type="audio")
+        for i in range(n_items * FILES_PER_ITEM)
+    ], batch_size=BATCH_SIZE)
+    link(File.media_language, sample_links(rng, files, languages, 1, 1))
+
+    return {
+        "Collections": len(collections),
+        "Folders": len(folders),
+        "Items": len(items),
+        "File": len(files),
+        "Languages": len(languages),
+        "Countries": len(countries),
+        "Organizations": len(organizations),
+        "Persons": len(persons),
+    }
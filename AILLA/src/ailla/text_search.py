@@ -0,0 +1,90 @@
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from unidecode import unidecode
+
+from .models import Text
+
+"""
+Indexed substring search over the diacritic-neutral Text columns, used by the `query`
+parameter of the collections, languages, countries and organizations endpoints.
+
+The query is folded with unidecode, like the *_neutral columns, and matched against those
+columns, so accented and unaccented spellings find the same rows. The matching Text ids
+come from an index instead of a scan of every Text row joined to the model:
+
+- on PostgreSQL, trigram GIN indexes on UPPER(*_neutral) serve the icontains lookups
+- on SQLite, the ailla_text_search FTS5 table (trigram tokenizer) serves queries of 3 or more
+  characters, shorter queries fall back to a plain scan
+
+Both are created by migration 0004_text_search_indexes.
+
+Text.save leaves a *_neutral column NULL when the folded text is over 300 characters. Those
+texts are matched on their original column with the query as typed, like before the neutral
+columns were indexed. Migration 0006_long_text_search_indexes indexes only these rows.
+"""
+
+FTS_TABLE = "ailla_text_search"
+
+# SQLite's trigram tokenizer can't match anything shorter
+FTS_MIN_LENGTH = 3
+
+_fts_available = None
+
+def fts_available():
+    """whether the SQLite FTS5 table exists, checked once per process"""
+    global _fts_available
+    if _fts_available is None:
+        _fts_available = connection.vendor == "sqlite" and FTS_TABLE in connection.introspection.table_names()
+    return _fts_available
+
+def fold(query):
+    """the query the way the *_neutral columns store text"""
+    return unidecode(query or "").strip()
+
+def matching_texts(query):
+    """ids of the Text rows with the folded query in any language, as a subquery"""
+    folded = fold(query)
+
+    if fts_available() and len(folded) >= FTS_MIN_LENGTH:
+        # a quoted phrase is matched as a substring by the trigram tokenizer
+        phrase = '"' + folded.replace('"', '""') + '"'
+        return Text.objects.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [phrase])
+        ).values("id")
+
+    return Text.objects.filter(
+        Q(en_neutral__icontains=folded) |
+        Q(es_neutral__icontains=folded) |
+        Q(pt_neutral__icontains=folded)
+    ).values("id")
+
+def long_texts(query):
+    """ids of the Text rows without a *_neutral value whose original text contains the query, as a subquery"""
+    return Text.objects.filter(
+        Q(en_neutral__isnull=True, en__icontains=query) |
+        Q(es_neutral__isnull=True, es__icontains=query) |
+        Q(pt_neutral__isnull=True, pt__icontains=query)
+    ).values("id")
+
+def search_filter(query, text_field, code_field=None):
+    """
+    Q matching rows whose text_field (a Text foreign key) contains the query in any language,
+    whose code_field contains it, or, for numeric queries, whose id contains it.
+    An empty query matches everything
+
+    Usage::
+
+        Languages.objects.filter(search_filter(query, "name", "language_code"))
+    """
+    folded = fold(query)
+    if not folded:
+        return Q()
+
+    condition = Q(**{f"{text_field}__in": matching_texts(folded)})
+    condition |= Q(**{f"{text_field}__in": long_texts(query.strip())})
+    if code_field is not None:
+        condition |= Q(**{f"{code_field}__icontains": folded})
+    if folded.isdigit():
+        condition |= Q(id__icontains=folded)
+    return condition